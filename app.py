@@ -1,12 +1,23 @@
-import io
+import hashlib
+import json
+import mimetypes
 import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import UTC, datetime
-from typing import Any, Dict, List, Optional
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from flask import (
     Flask,
+    Request,
+    g,
     jsonify,
     redirect,
     render_template,
@@ -15,10 +26,111 @@ from flask import (
     session,
     url_for,
 )
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import check_password_hash, generate_password_hash, safe_join
 
-try:
-    from supabase import Client, create_client
+load_dotenv()
+
+
+class UploadRequest(Request):
+    def _get_file_stream(
+        self,
+        total_content_length: Optional[int],
+        content_type: Optional[str],
+        filename: Optional[str] = None,
+        content_length: Optional[int] = None,
+    ) -> IO[bytes]:
+        # Spool uploaded files to named temporary files so storage3 can stream
+        # them from disk instead of taking them as bytes.
+        return tempfile.NamedTemporaryFile("wb+")  # type: ignore[return-value]
+
+
+app = Flask(__name__)
+app.request_class = UploadRequest
+app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret-key")
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "Images")
+SUPABASE_BOOK_BUCKET = os.getenv("SUPABASE_BOOK_BUCKET", "books")
+SUPABASE_TRUST_ENV = (os.getenv("SUPABASE_TRUST_ENV", "true").lower() in ("1", "true", "yes"))
+ALLOWED_REACTIONS = {"like", "love", "wow", "clap"}
+ELEVATED_ROLES = {"master", "admin"}
+FEED_SNAPSHOT_TTL = int(os.getenv("FEED_SNAPSHOT_TTL", "60"))
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite").lower()
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(tempfile.gettempdir(), "shiningbrows-cache.sqlite3"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+# How long the memory backend remembers a deleted key; longer than the TTL of
+# anything that gets deleted (content lists, upload tickets).
+CACHE_TOMBSTONE_TTL = 60 * 60 * 24
+STUDENT_CACHE_TTL = int(os.getenv("STUDENT_CACHE_TTL", "30"))
+CONTENT_CACHE_TTL = int(os.getenv("CONTENT_CACHE_TTL", "300"))
+PHOTO_PERCEPTUAL_HASH = os.getenv("PHOTO_PERCEPTUAL_HASH", "false").lower() in ("1", "true", "yes")
+PHOTO_PHASH_DISTANCE = int(os.getenv("PHOTO_PHASH_DISTANCE", "6"))
+# Deadlines for Supabase calls; supabase-py defaults to 120 s for table queries.
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "5"))
+SUPABASE_STORAGE_TIMEOUT = float(os.getenv("SUPABASE_STORAGE_TIMEOUT", "30"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+# How long last-known-good copies are kept for serving while Supabase is down.
+STALE_TTL = int(os.getenv("STALE_TTL", str(60 * 60 * 24 * 7)))
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", os.path.join(tempfile.gettempdir(), "shiningbrows-outbox.sqlite3"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("OUTBOX_FLUSH_INTERVAL", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+# How long an exiting worker keeps flushing the outbox before giving up.
+OUTBOX_DRAIN_TIMEOUT = float(os.getenv("OUTBOX_DRAIN_TIMEOUT", "10"))
+OUTBOX_BASE_BACKOFF = 1.0
+OUTBOX_MAX_BACKOFF = 300.0
+# Claimed records go back to the queue if their lease lapses (say the worker
+# died). The lease is renewed before every upsert, so it only has to outlast
+# one call.
+OUTBOX_LEASE = SUPABASE_TIMEOUT * 2 + 5
+# Tables whose rows already have a natural key; outbox upserts use it instead
+# of an idempotency_key column.
+OUTBOX_CONFLICT_KEYS = {"photo_reactions": "photo_id,student_id"}
+ANALYTICS_PATH = os.getenv("ANALYTICS_PATH", os.path.join(tempfile.gettempdir(), "shiningbrows-analytics.sqlite3"))
+ANALYTICS_RECONCILE_INTERVAL = int(os.getenv("ANALYTICS_RECONCILE_INTERVAL", "3600"))
+ANALYTICS_TOP_N = int(os.getenv("ANALYTICS_TOP_N", "10"))
+# PostgREST caps rows per response (1000 by default), so full scans are paged.
+ANALYTICS_PAGE_SIZE = 1000
+SIGNED_URL_EXPIRES_IN = 60 * 60 * 24 * 7
+# Hand out cached signed URLs only while they stay valid for at least another day.
+SIGNED_URL_CACHE_TTL = SIGNED_URL_EXPIRES_IN - 60 * 60 * 24
+# Supabase signed upload URLs are valid for two hours.
+UPLOAD_URL_TTL = 60 * 60 * 2
+HEIC_EXTENSIONS = {".heic", ".heif"}
+HEIC_MIMETYPES = {"image/heic", "image/heif", "image/heic-sequence", "image/heif-sequence"}
+# Leading bytes of JPEG, PNG and GIF files; WebP and AVIF are matched separately.
+IMAGE_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a")
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", str(20 * 1024 * 1024)))
+BOOK_MAX_BYTES = int(os.getenv("BOOK_MAX_BYTES", str(50 * 1024 * 1024)))
+# 50 MP fits a 48 MP phone camera; larger images are rejected before decoding.
+PHOTO_MAX_PIXELS = int(os.getenv("PHOTO_MAX_PIXELS", "50000000"))
+PHOTO_MAX_SIDE = int(os.getenv("PHOTO_MAX_SIDE", "2560"))
+SPOOL_MAX_MEMORY = 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Leave room for multipart overhead on top of the largest allowed file.
+app.config["MAX_CONTENT_LENGTH"] = max(PHOTO_MAX_BYTES, BOOK_MAX_BYTES) + 1024 * 1024
+
+
+# The Supabase client (and supabase-py itself) is created on first use rather
+# than at import time, keeping cold starts short; warm_up() builds it in the
+# background once a worker is serving.
+_supabase_client: Any = None
+_supabase_ready = False
+_supabase_lock = threading.Lock()
+
+
+def _create_supabase_client() -> Any:
+    if not (SUPABASE_URL and SUPABASE_KEY):
+        print("Supabase config missing")
+        return None
+    try:
+        from supabase import create_client
+    except ImportError:
+        print("supabase-py not installed")
+        return None
     try:
         # Some supabase-py versions don't accept http_client; patch to ignore it if present.
         import inspect
@@ -43,60 +155,905 @@ try:
             _SupabaseClient.__init__ = _patched_client_init  # type: ignore[assignment]
     except Exception:
         pass
-except ImportError:
-    Client = None
-    create_client = None
+    try:
+        from supabase import ClientOptions
 
-load_dotenv()
+        options = ClientOptions(
+            postgrest_client_timeout=SUPABASE_TIMEOUT,
+            storage_client_timeout=SUPABASE_STORAGE_TIMEOUT,
+        )
+    except ImportError:
+        options = None
+    try:
+        # Disable proxy usage for Supabase if desired (common cause of proxy errors).
+        client = create_client(SUPABASE_URL, SUPABASE_KEY, options)
+        print("Supabase client created")
+        return client
+    except Exception as exc:
+        print("Supabase client could not be created.", exc)
+        return None
 
-app = Flask(__name__)
-app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret-key")
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "Images")
-SUPABASE_BOOK_BUCKET = os.getenv("SUPABASE_BOOK_BUCKET", "books")
-SUPABASE_TRUST_ENV = (os.getenv("SUPABASE_TRUST_ENV", "true").lower() in ("1", "true", "yes"))
-ALLOWED_REACTIONS = {"like", "love", "wow", "clap"}
-ELEVATED_ROLES = {"master", "admin"}
+def get_supabase() -> Any:
+    """Return the shared Supabase client, creating it on first call (None if unavailable)."""
+    global _supabase_client, _supabase_ready
+    if not _supabase_ready:
+        with _supabase_lock:
+            if not _supabase_ready:
+                _supabase_client = _create_supabase_client()
+                _supabase_ready = True
+    return _supabase_client
+
+
+# ---------- Cache ----------
+
+class SQLiteStore:
+    """Base for local SQLite files shared by every worker on the dyno.
+
+    The database runs in WAL mode so readers never block the writer.
+    """
 
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute("PRAGMA journal_mode=WAL")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are per thread and per process; gunicorn forks after import.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a block under a write lock, committing on success."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+class GenerationStore(SQLiteStore):
+    """Namespace generations and deleted keys shared by every worker through one SQLite file."""
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_generations ("
+            "namespace TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_tombstones ("
+            "key TEXT PRIMARY KEY, deleted_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def generation(self, namespace: str) -> int:
+        row = self._connect().execute(
+            "SELECT value FROM cache_generations WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, namespace: str) -> None:
+        self._connect().execute(
+            "INSERT INTO cache_generations (namespace, value) VALUES (?, 1) "
+            "ON CONFLICT(namespace) DO UPDATE SET value = value + 1",
+            (namespace,),
+        )
 
-supabase: Optional[Client] = None
-if SUPABASE_URL and SUPABASE_KEY and create_client:
+    def mark_deleted(self, key: str, ttl: float) -> None:
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_tombstones (key, deleted_at, expires_at) VALUES (?, ?, ?)",
+            (key, now, now + ttl),
+        )
+        conn.execute("DELETE FROM cache_tombstones WHERE expires_at <= ?", (now,))
+
+    def changed(self) -> bool:
+        """True when another connection has written to the file since this thread last asked."""
+        # data_version is a per-connection change counter; reading it touches no table.
+        conn = self._connect()
+        state = (conn, conn.execute("PRAGMA data_version").fetchone()[0])
+        if getattr(self._local, "data_state", None) == state:
+            return False
+        self._local.data_state = state
+        return True
+
+    def load(self) -> Tuple[Dict[str, int], Dict[str, float]]:
+        """Return all namespace generations and live tombstones."""
+        conn = self._connect()
+        generations = dict(conn.execute("SELECT namespace, value FROM cache_generations").fetchall())
+        tombstones = dict(
+            conn.execute("SELECT key, deleted_at FROM cache_tombstones WHERE expires_at > ?", (time.time(),)).fetchall()
+        )
+        return generations, tombstones
+
+
+class SQLiteCache(GenerationStore):
+    """Cache shared by every worker on the dyno through one SQLite file.
+
+    Generations live in the same file, so ``invalidate`` reaches every worker.
+    Values must be JSON-serialisable.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self._sets = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{namespace}:{self.generation(namespace)}:{key}"
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ?", (self._key(namespace, key),)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return json.loads(value)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (self._key(namespace, key), json.dumps(value, default=str), expires_at),
+        )
+        self._sets += 1
+        if self._sets % 200 == 0:
+            conn.execute("DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._connect().execute("DELETE FROM cache_entries WHERE key = ?", (self._key(namespace, key),))
+
+    def invalidate(self, namespace: str) -> None:
+        self.bump(namespace)
+
+
+class MemoryCache:
+    """In-process LRU cache with per-entry TTLs.
+
+    With a :class:`GenerationStore`, invalidations and deletes reach every
+    worker; it is only re-read when another connection has written to it.
+    """
+
+    def __init__(self, maxsize: int = 1024, generations: Optional["GenerationStore"] = None) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[float], float]]" = OrderedDict()
+        self._shared = generations
+        self._generations: Dict[str, int] = {}
+        self._tombstones: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._sync(force=True)
+
+    def _sync(self, force: bool = False) -> None:
+        if self._shared is not None and (self._shared.changed() or force):
+            generations, tombstones = self._shared.load()
+            with self._lock:
+                self._generations, self._tombstones = generations, tombstones
+
+    def generation(self, namespace: str) -> int:
+        self._sync()
+        return self._generations.get(namespace, 0)
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        full_key = f"{namespace}:{self.generation(namespace)}:{key}"
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is None:
+                return None
+            value, expires_at, stored_at = entry
+            deleted_at = self._tombstones.get(f"{namespace}:{key}")
+            if (expires_at is not None and expires_at <= time.time()) or (
+                deleted_at is not None and stored_at <= deleted_at
+            ):
+                del self._entries[full_key]
+                return None
+            self._entries.move_to_end(full_key)
+            return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        full_key = f"{namespace}:{self.generation(namespace)}:{key}"
+        with self._lock:
+            self._entries[full_key] = (value, expires_at, now)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, namespace: str, key: str) -> None:
+        # Other workers may hold their own copy, so leave a tombstone that
+        # hides anything stored before now.
+        if self._shared is not None:
+            self._shared.mark_deleted(f"{namespace}:{key}", CACHE_TOMBSTONE_TTL)
+            self._sync(force=True)
+        with self._lock:
+            self._entries.pop(f"{namespace}:{self._generations.get(namespace, 0)}:{key}", None)
+
+    def invalidate(self, namespace: str) -> None:
+        if self._shared is not None:
+            self._shared.bump(namespace)
+            self._sync(force=True)
+        else:
+            with self._lock:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+
+def create_cache() -> Any:
+    """Build the cache backend selected by ``CACHE_BACKEND`` (``sqlite`` or ``memory``).
+
+    Falls back to a process-local memory cache if ``CACHE_PATH`` cannot be opened.
+    """
     try:
-        # Disable proxy usage for Supabase if desired (common cause of proxy errors).
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("Supabase client created")
+        if CACHE_BACKEND == "memory":
+            return MemoryCache(CACHE_MAX_ENTRIES, GenerationStore(CACHE_PATH))
+        return SQLiteCache(CACHE_PATH)
+    except sqlite3.Error as exc:
+        print("SQLite cache unavailable, falling back to process-local memory cache:", exc)
+        return MemoryCache(CACHE_MAX_ENTRIES)
+
+
+cache = create_cache()
+
+
+# ---------- Circuit breakers ----------
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+def is_upstream_failure(exc: Exception) -> bool:
+    """Tell "Supabase is unreachable or failing" apart from "the request was rejected"."""
+    if isinstance(exc, (OSError, TimeoutError)):
+        return True
+    if type(exc).__module__.split(".")[0] in ("httpx", "httpcore"):
+        # HTTPStatusError carries the response; a 4xx (say a missing object) is a rejection.
+        response = getattr(exc, "response", None)
+        return response is None or response.status_code >= 500
+    # postgrest's APIError exposes ``code`` as an attribute: the HTTP status
+    # (an int) for gateway errors, a SQLSTATE string such as "23505" for
+    # rejected queries. storage3 passes a dict with ``statusCode``. Only an
+    # integer status of 500 or more means the upstream itself is failing.
+    statuses = [getattr(exc, "code", None)]
+    details = exc.args[0] if exc.args else None
+    if isinstance(details, dict):
+        statuses += [details.get("statusCode"), details.get("code")]
+    return any(isinstance(status, int) and not isinstance(status, bool) and status >= 500 for status in statuses)
+
+
+class CircuitBreaker:
+    """Stop calling an upstream after ``failure_threshold`` consecutive failures.
+
+    While open, calls raise CircuitOpenError; after ``reset_timeout`` one trial
+    call decides whether it closes. State is per worker process.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            if self._opened_at is not None:
+                if self._trial_running or time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"{self.name} circuit is open")
+                self._trial_running = True
+        upstream_failed = True
+        try:
+            result = fn(*args, **kwargs)
+            upstream_failed = False
+        except Exception as exc:
+            upstream_failed = is_upstream_failure(exc)
+            raise
+        finally:
+            # Also runs when a BaseException (a gevent timeout, say) interrupts
+            # the call, so a trial can never leave the circuit stuck open.
+            if upstream_failed:
+                self._record_failure()
+            else:
+                self._record_success()
+        return result
+
+    def _record_failure(self) -> None:
+        with self._lock:
+            self._trial_running = False
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"{self.name} circuit opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+
+    def _record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                print(f"{self.name} circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+
+db_breaker = CircuitBreaker("supabase-db", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+storage_breaker = CircuitBreaker("supabase-storage", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+
+
+def run_db(query: Any) -> Any:
+    """Execute a PostgREST query builder through the database circuit breaker."""
+    return db_breaker.call(query.execute)
+
+
+def run_storage(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Call a Supabase storage method through the storage circuit breaker."""
+    return storage_breaker.call(fn, *args, **kwargs)
+
+
+def mark_stale() -> None:
+    """Flag the current response as served from last-known-good data."""
+    g.served_stale = True
+
+
+@app.after_request
+def add_stale_header(response: Any) -> Any:
+    if g.get("served_stale"):
+        response.headers["X-Data-Stale"] = "1"
+    return response
+
+
+# ---------- Outbox ----------
+
+class Outbox(SQLiteStore):
+    """Durable write-behind queue for non-critical Supabase writes.
+
+    Claims are leases, so one worker flushes at a time; records sharing an
+    ``order_key`` are delivered in queue order.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "idempotency_key TEXT NOT NULL UNIQUE, "
+            "table_name TEXT NOT NULL, "
+            "student_id INTEGER, "
+            "order_key TEXT, "
+            "payload TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt_at REAL NOT NULL, "
+            "claimed_until REAL NOT NULL DEFAULT 0, "
+            "last_error TEXT, "
+            "created_at REAL NOT NULL)"
+        )
+        if "order_key" not in {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}:
+            conn.execute("ALTER TABLE outbox ADD COLUMN order_key TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS outbox_owner ON outbox (table_name, student_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS outbox_order ON outbox (order_key)")
+
+    def enqueue(
+        self,
+        table: str,
+        record: Dict[str, Any],
+        idempotency_key: str,
+        student_id: Optional[int],
+        order_key: Optional[str] = None,
+    ) -> bool:
+        """Queue ``record`` for ``table``. Returns False if the key was already queued."""
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(idempotency_key, table_name, student_id, order_key, payload, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (idempotency_key, table, student_id, order_key, json.dumps(record, default=str), now, now),
+            )
+            if cursor.rowcount == 1 and order_key:
+                # The new record is a full upsert of the same row, so older
+                # unsent ones are superseded.
+                conn.execute(
+                    "DELETE FROM outbox WHERE order_key = ? AND id < ? AND claimed_until <= ?",
+                    (order_key, cursor.lastrowid, now),
+                )
+        return cursor.rowcount == 1
+
+    def claim(self, limit: int) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """Lease due records, oldest first; empty while another worker holds a lease.
+
+        A record waits only for older live records with the same ``order_key``.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM outbox WHERE claimed_until > ? LIMIT 1", (now,)).fetchone():
+                return []
+            rows = conn.execute(
+                "SELECT id, table_name, payload FROM outbox AS o "
+                "WHERE attempts < ? AND next_attempt_at <= ? AND (order_key IS NULL OR NOT EXISTS ("
+                "SELECT 1 FROM outbox AS e WHERE e.order_key = o.order_key AND e.id < o.id AND e.attempts < ?)) "
+                "ORDER BY id LIMIT ?",
+                (OUTBOX_MAX_ATTEMPTS, now, OUTBOX_MAX_ATTEMPTS, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET claimed_until = ? WHERE id = ?",
+                [(now + OUTBOX_LEASE, row[0]) for row in rows],
+            )
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def renew(self, ids: List[int]) -> None:
+        """Extend the lease on records about to be sent."""
+        until = time.time() + OUTBOX_LEASE
+        self._connect().executemany(
+            "UPDATE outbox SET claimed_until = ? WHERE id = ?", [(until, row_id) for row_id in ids]
+        )
+
+    def complete(self, ids: List[int]) -> None:
+        self._connect().executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def reschedule(self, ids: List[int], error: str) -> None:
+        """Retry once the breaker would let a probe through, without spending an attempt."""
+        retry_at = time.time() + BREAKER_RESET_TIMEOUT
+        self._connect().executemany(
+            "UPDATE outbox SET claimed_until = 0, last_error = ?, next_attempt_at = ? WHERE id = ?",
+            [(error, retry_at, row_id) for row_id in ids],
+        )
+
+    def fail(self, ids: List[int], error: str) -> None:
+        """Charge an attempt to records Supabase rejected and back them off."""
+        now = time.time()
+        self._connect().executemany(
+            "UPDATE outbox SET attempts = attempts + 1, claimed_until = 0, last_error = ?, "
+            "next_attempt_at = ? + MIN(?, ? * (1 << MIN(attempts, 16))) WHERE id = ?",
+            [(error, now, OUTBOX_MAX_BACKOFF, OUTBOX_BASE_BACKOFF, row_id) for row_id in ids],
+        )
+
+    def count(self, due_only: bool = False) -> int:
+        """Count live records, or only those ready to be claimed now."""
+        query = "SELECT COUNT(*) FROM outbox WHERE attempts < ?"
+        params: Tuple[Any, ...] = (OUTBOX_MAX_ATTEMPTS,)
+        if due_only:
+            query += " AND next_attempt_at <= ?"
+            params += (time.time(),)
+        return self._connect().execute(query, params).fetchone()[0]
+
+    def pending(self, table: str, student_id: int) -> List[Dict[str, Any]]:
+        """Return a student's not-yet-sent records for ``table``, oldest first."""
+        rows = self._connect().execute(
+            "SELECT payload FROM outbox WHERE table_name = ? AND student_id = ? AND attempts < ? ORDER BY id",
+            (table, student_id, OUTBOX_MAX_ATTEMPTS),
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+outbox = Outbox(OUTBOX_PATH)
+_outbox_wakeup = threading.Event()
+_outbox_flusher_pid: Optional[int] = None
+_outbox_flusher_lock = threading.Lock()
+
+
+def queue_write(table: str, record: Dict[str, Any], student_id: Optional[int]) -> Dict[str, Any]:
+    """Queue a non-critical insert/upsert and wake the flusher.
+
+    The client's ``Idempotency-Key`` header, if sent, keeps a retried POST
+    from being queued or stored twice.
+    """
+    key = (request.headers.get("Idempotency-Key") or "").strip() or uuid.uuid4().hex
+    natural_key = OUTBOX_CONFLICT_KEYS.get(table)
+    order_key = None
+    if natural_key:
+        order_key = table + ":" + ",".join(str(record.get(col)) for col in natural_key.split(","))
+    else:
+        record = dict(record, idempotency_key=key)
+    outbox.enqueue(table, record, f"{table}:{student_id}:{key}", student_id, order_key)
+    start_outbox_flusher()
+    _outbox_wakeup.set()
+    return record
+
+
+def is_retryable(exc: Exception) -> bool:
+    """True when Supabase could not be reached, as opposed to rejecting the rows."""
+    return isinstance(exc, CircuitOpenError) or is_upstream_failure(exc)
+
+
+def send_outbox_rows(table: str, rows: List[Dict[str, Any]]) -> Any:
+    supabase = get_supabase()
+    natural_key = OUTBOX_CONFLICT_KEYS.get(table)
+    if natural_key:
+        return run_db(supabase.table(table).upsert(rows, on_conflict=natural_key))
+    return run_db(supabase.table(table).upsert(rows, on_conflict="idempotency_key", ignore_duplicates=True))
+
+
+def invalidate_after_write(table: str) -> None:
+    if table in ("photo_reactions", "photo_feedbacks"):
+        invalidate_feed_snapshot()
+    elif table == "quick_tips":
+        cache.delete("content", "quick_tips")
+
+
+def deliver_outbox_rows(table: str, items: List[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Send queued records for one table and settle each of them in the outbox.
+
+    Returns the newly written rows. A rejected batch is resent one record at
+    a time, so only the bad ones are charged an attempt.
+    """
+    ids = [row_id for row_id, _ in items]
+    outbox.renew(ids)
+    try:
+        response = send_outbox_rows(table, [payload for _, payload in items])
     except Exception as exc:
-        supabase = None
-        print("Supabase client could not be created.", exc)
-else:
-    print("Supabase config missing or supabase-py not installed")
+        if is_retryable(exc):
+            print(f"Outbox flush to {table} deferred:", exc)
+            outbox.reschedule(ids, str(exc))
+            return []
+        if len(items) == 1:
+            print(f"Outbox record for {table} rejected:", exc)
+            outbox.fail(ids, str(exc))
+            return []
+        delivered: List[Dict[str, Any]] = []
+        for item in items:
+            delivered += deliver_outbox_rows(table, [item])
+        return delivered
+    # Invalidate before deleting, so readers never see the write missing from both.
+    invalidate_after_write(table)
+    outbox.complete(ids)
+    if table in OUTBOX_CONFLICT_KEYS:
+        return [payload for _, payload in items]
+    # With ignore_duplicates PostgREST returns only the rows it inserted.
+    return getattr(response, "data", None) or []
+
+
+def flush_outbox_batch() -> int:
+    """Send one batch of queued records; returns how many were claimed."""
+    if not get_supabase():
+        return 0
+    claimed = outbox.claim(OUTBOX_BATCH_SIZE)
+    by_table: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    for row_id, table, payload in claimed:
+        by_table.setdefault(table, []).append((row_id, payload))
+
+    for table, items in by_table.items():
+        delivered = deliver_outbox_rows(table, items)
+        if delivered:
+            record_activity(table, delivered)
+    return len(claimed)
+
+
+def _outbox_flush_loop() -> None:
+    while True:
+        _outbox_wakeup.wait(OUTBOX_FLUSH_INTERVAL)
+        _outbox_wakeup.clear()
+        try:
+            while flush_outbox_batch() >= OUTBOX_BATCH_SIZE:
+                pass
+        except Exception as exc:
+            print("Outbox flush failed:", exc)
+        # The flusher's tick also drives periodic analytics reconciliation.
+        maybe_reconcile_analytics()
+
+
+def drain_outbox(timeout: float = OUTBOX_DRAIN_TIMEOUT) -> int:
+    """Flush until nothing is due or ``timeout`` passes; returns how many records are left."""
+    deadline = time.monotonic() + timeout
+    while get_supabase() and time.monotonic() < deadline:
+        try:
+            if flush_outbox_batch():
+                continue
+        except Exception as exc:
+            print("Outbox drain failed:", exc)
+            break
+        if not outbox.count(due_only=True):
+            break
+        # Another worker holds the lease; let it finish its batch.
+        time.sleep(0.2)
+    left = outbox.count()
+    if left:
+        print(f"Outbox drain left {left} records queued")
+    return left
+
+
+def start_outbox_flusher() -> None:
+    """Start this worker's flusher thread once (and again in a forked child)."""
+    global _outbox_flusher_pid
+    with _outbox_flusher_lock:
+        if _outbox_flusher_pid == os.getpid():
+            return
+        _outbox_flusher_pid = os.getpid()
+    threading.Thread(target=_outbox_flush_loop, name="outbox-flusher", daemon=True).start()
+
+
+# ---------- Analytics rollups ----------
+
+class AnalyticsRollups(SQLiteStore):
+    """Activity counters behind the admin analytics endpoint.
+
+    Counters are bumped as writes land (photo inserts and outbox flushes), so
+    reading them never scans the photo tables. ``replace_all`` rebuilds them
+    from a full Supabase scan, which periodically corrects drift from other
+    dynos, support tickets closed outside the app and lost local files.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS analytics_counters ("
+            "metric TEXT NOT NULL, dim TEXT NOT NULL, value INTEGER NOT NULL, "
+            "PRIMARY KEY (metric, dim))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS analytics_counters_rank ON analytics_counters (metric, value)")
+        # One row per (photo, student), so a changed reaction is not counted twice.
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS analytics_reactions ("
+            "photo_id TEXT NOT NULL, student_id TEXT NOT NULL, reaction TEXT NOT NULL, "
+            "PRIMARY KEY (photo_id, student_id))"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS analytics_meta (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+
+    @staticmethod
+    def _bump(conn: sqlite3.Connection, metric: str, dim: Any, delta: int = 1) -> int:
+        conn.execute(
+            "INSERT INTO analytics_counters (metric, dim, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (metric, dim) DO UPDATE SET value = value + excluded.value",
+            (metric, str(dim), delta),
+        )
+        row = conn.execute(
+            "SELECT value FROM analytics_counters WHERE metric = ? AND dim = ?", (metric, str(dim))
+        ).fetchone()
+        return row[0]
+
+    def _fold(self, conn: sqlite3.Connection, table: str, row: Dict[str, Any]) -> None:
+        if table == "photos":
+            self._bump(conn, "total", "photos")
+            self._bump(conn, "photos_by_month", str(row.get("created_at") or "")[:7] or "unknown")
+        elif table == "photo_reactions":
+            photo_id, student_id, reaction = str(row.get("photo_id")), str(row.get("student_id")), row.get("reaction")
+            if reaction not in ALLOWED_REACTIONS:
+                return
+            previous = conn.execute(
+                "SELECT reaction FROM analytics_reactions WHERE photo_id = ? AND student_id = ?",
+                (photo_id, student_id),
+            ).fetchone()
+            if previous and previous[0] == reaction:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO analytics_reactions (photo_id, student_id, reaction) VALUES (?, ?, ?)",
+                (photo_id, student_id, reaction),
+            )
+            if previous:
+                self._bump(conn, "reactions_by_type", previous[0], -1)
+            else:
+                self._bump(conn, "total", "reactions")
+                self._bump(conn, "reactions_by_photo", photo_id)
+                self._bump(conn, "reactions_by_student", student_id)
+            self._bump(conn, "reactions_by_type", reaction)
+        elif table == "photo_feedbacks":
+            self._bump(conn, "total", "feedbacks")
+            if self._bump(conn, "feedbacks_by_photo", row.get("photo_id")) == 1:
+                self._bump(conn, "total", "photos_with_feedback")
+        elif table == "support_requests":
+            self._bump(conn, "support_by_status", row.get("status") or "open")
+
+    def record(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        """Fold rows that were just written to ``table`` into the counters."""
+        with self.transaction() as conn:
+            for row in rows:
+                self._fold(conn, table, row)
+
+    def replace_all(self, tables: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Rebuild every counter from complete table scans."""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM analytics_counters")
+            conn.execute("DELETE FROM analytics_reactions")
+            for table, rows in tables.items():
+                for row in rows:
+                    self._fold(conn, table, row)
+            conn.execute(
+                "INSERT OR REPLACE INTO analytics_meta (key, value) VALUES ('reconciled_at', ?)", (time.time(),)
+            )
+
+    def meta(self, key: str) -> Optional[float]:
+        row = self._connect().execute("SELECT value FROM analytics_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def try_lease(self, key: str, seconds: float) -> bool:
+        """Take a named lease shared by all workers; False while someone else holds it."""
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT value FROM analytics_meta WHERE key = ?", (key,)).fetchone()
+            if row and row[0] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO analytics_meta (key, value) VALUES (?, ?)", (key, now + seconds))
+        return True
+
+    def summary(self, limit: int, months: int = 12) -> Dict[str, Any]:
+        """Read the dashboard figures; every query is an indexed lookup or a bounded range."""
+        conn = self._connect()
+
+        def counters(metric: str) -> Dict[str, int]:
+            rows = conn.execute("SELECT dim, value FROM analytics_counters WHERE metric = ? AND value > 0", (metric,))
+            return {dim: value for dim, value in rows}
+
+        def top(metric: str) -> List[Dict[str, Any]]:
+            rows = conn.execute(
+                "SELECT dim, value FROM analytics_counters WHERE metric = ? AND value > 0 "
+                "ORDER BY value DESC LIMIT ?",
+                (metric, limit),
+            )
+            return [{"id": dim, "count": value} for dim, value in rows]
+
+        totals = counters("total")
+        support = counters("support_by_status")
+        # Photos without a created_at are counted under "unknown", which would
+        # sort ahead of every YYYY-MM key.
+        by_month = conn.execute(
+            "SELECT dim, value FROM analytics_counters WHERE metric = 'photos_by_month' "
+            "AND dim GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]' ORDER BY dim DESC LIMIT ?",
+            (months,),
+        ).fetchall()
+        photo_total = totals.get("photos", 0)
+        with_feedback = totals.get("photos_with_feedback", 0)
+        reconciled_at = self.meta("reconciled_at")
+        return {
+            "photos": {
+                "total": photo_total,
+                "by_month": [{"month": month, "count": count} for month, count in reversed(by_month)],
+            },
+            "reactions": {
+                "total": totals.get("reactions", 0),
+                "by_type": counters("reactions_by_type"),
+                "top_photos": top("reactions_by_photo"),
+                "top_students": top("reactions_by_student"),
+            },
+            "feedback": {
+                "total": totals.get("feedbacks", 0),
+                "photos_with_feedback": with_feedback,
+                "coverage": round(with_feedback / photo_total, 3) if photo_total else 0.0,
+            },
+            "support": {"open": support.get("open", 0), "by_status": support},
+            "reconciled_at": datetime.fromtimestamp(reconciled_at, UTC).isoformat() if reconciled_at else None,
+        }
+
+
+analytics = AnalyticsRollups(ANALYTICS_PATH)
+
+# Columns needed to rebuild the rollups, per table.
+ANALYTICS_SOURCES = {
+    "photos": "id,created_at",
+    "photo_reactions": "id,photo_id,student_id,reaction",
+    "photo_feedbacks": "id,photo_id",
+    "support_requests": "id,status",
+}
+
+
+def record_activity(table: str, rows: List[Dict[str, Any]]) -> None:
+    """Update the analytics rollups after a successful write; never raises."""
+    try:
+        analytics.record(table, rows)
+    except Exception as exc:
+        print("Analytics update failed:", exc)
+
+
+def fetch_all_rows(table: str, columns: str) -> List[Dict[str, Any]]:
+    """Read a whole table page by page. Raises if any page fails."""
+    supabase = get_supabase()
+    rows: List[Dict[str, Any]] = []
+    while True:
+        page = run_db(
+            supabase.table(table)
+            .select(columns)
+            .order("id")
+            .range(len(rows), len(rows) + ANALYTICS_PAGE_SIZE - 1)
+        )
+        data = getattr(page, "data", []) or []
+        rows.extend(data)
+        if len(data) < ANALYTICS_PAGE_SIZE:
+            return rows
+
+
+def reconcile_analytics() -> None:
+    """Rebuild the rollups from Supabase. A full scan, so it only runs in the background."""
+    started = time.perf_counter()
+    tables = {table: fetch_all_rows(table, columns) for table, columns in ANALYTICS_SOURCES.items()}
+    analytics.replace_all(tables)
+    print(f"Analytics reconciled in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+def maybe_reconcile_analytics() -> None:
+    """Start a background reconciliation when the rollups are older than ANALYTICS_RECONCILE_INTERVAL.
+
+    A lease in the rollup file makes sure only one worker on the dyno scans.
+    """
+    try:
+        if not get_supabase():
+            return
+        if time.time() - (analytics.meta("reconciled_at") or 0) < ANALYTICS_RECONCILE_INTERVAL:
+            return
+        if not analytics.try_lease("reconcile_lease", max(60, ANALYTICS_RECONCILE_INTERVAL / 4)):
+            return
+    except Exception as exc:
+        print("Analytics reconcile check failed:", exc)
+        return
+
+    def _run() -> None:
+        try:
+            reconcile_analytics()
+        except Exception as exc:
+            print("Analytics reconcile failed:", exc)
+
+    threading.Thread(target=_run, name="analytics-reconcile", daemon=True).start()
 
 
 # ---------- Helpers ----------
 
-def fetch_table(table: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+def query_table(table: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     """
-    Fetch data from Supabase
+    Fetch data from Supabase, raising on failure
     """
+    supabase = get_supabase()
     if not supabase:
         return []
 
+    query = supabase.table(table).select("*")
+    if filters is not None:
+        for key, value in filters.items():
+            query = query.eq(key, value)
+    response = run_db(query)
+    return getattr(response, "data", None) or []
+
+
+def fetch_table(table: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Fetch data from Supabase
+    """
     try:
-        query = supabase.table(table).select("*")
-        if filters is not None:
-            for key, value in filters.items():
-                query = query.eq(key, value)
-        response = query.execute()
-        if hasattr(response, "data"):
-            return response.data or []
+        return query_table(table, filters)
     except Exception as exc:
         print(f"Supabase fetch exception for {table}: {exc}")
 
     return []
 
 
+def signed_url_from_response(resp: Any) -> Optional[str]:
+    """Pull the URL out of a ``create_signed_url`` response; its shape varies by storage3 version."""
+    if isinstance(resp, dict):
+        url = resp.get("signedURL") or resp.get("signedUrl") or resp.get("signed_url")
+        if not url and isinstance(resp.get("data"), dict):
+            data = resp.get("data")
+            url = data.get("signedURL") or data.get("signedUrl") or data.get("signed_url")
+        return url
+    data = getattr(resp, "data", None)
+    return (
+        getattr(resp, "signedURL", None)
+        or getattr(resp, "signedUrl", None)
+        or getattr(resp, "signed_url", None)
+        or (data.get("signedURL") if isinstance(data, dict) else None)
+        or (data.get("signedUrl") if isinstance(data, dict) else None)
+        or (data.get("signed_url") if isinstance(data, dict) else None)
+    )
+
+
 def build_image_url(path: str) -> Optional[str]:
     """Return a browser-friendly URL for a stored image.
 
@@ -108,26 +1065,17 @@ def build_image_url(path: str) -> Optional[str]:
         return None
     if path.startswith("http://") or path.startswith("https://"):
         return path
+    supabase = get_supabase()
     if not supabase:
         return None
+    cached = cache.get("signed_urls", path)
+    if cached:
+        return cached
     try:
-        resp = supabase.storage.from_(SUPABASE_BUCKET).create_signed_url(path, 60 * 60 * 24 * 7)
-        if isinstance(resp, dict):
-            url = resp.get("signedURL") or resp.get("signedUrl") or resp.get("signed_url")
-            if not url and isinstance(resp.get("data"), dict):
-                data = resp.get("data")
-                url = data.get("signedURL") or data.get("signedUrl") or data.get("signed_url")
-        else:
-            data = getattr(resp, "data", None)
-            url = (
-                getattr(resp, "signedURL", None)
-                or getattr(resp, "signedUrl", None)
-                or getattr(resp, "signed_url", None)
-                or (data.get("signedURL") if isinstance(data, dict) else None)
-                or (data.get("signedUrl") if isinstance(data, dict) else None)
-                or (data.get("signed_url") if isinstance(data, dict) else None)
-            )
+        resp = run_storage(supabase.storage.from_(SUPABASE_BUCKET).create_signed_url, path, SIGNED_URL_EXPIRES_IN)
+        url = signed_url_from_response(resp)
         if url:
+            cache.set("signed_urls", path, url, SIGNED_URL_CACHE_TTL)
             return url
     except Exception as exc:
         print("Signed URL generation failed:", exc)
@@ -142,36 +1090,259 @@ def build_image_url(path: str) -> Optional[str]:
     return None
 
 
-def convert_image_if_needed(file_bytes: bytes, mimetype: str, extension: str):
-    """Convert HEIC/HEIF images to JPEG for browser compatibility.
+def issue_upload_url(bucket: str, storage_key: str, pending: Dict[str, Any]) -> Dict[str, Any]:
+    """Create a signed upload URL for a server-chosen key.
 
-    Returns a tuple of (bytes, mimetype, extension). If conversion fails,
-    the original values are returned.
+    ``pending`` is remembered in the shared cache until the URL expires so the
+    matching finalize call can check who asked for the key and what it is for.
     """
-    ext_lower = (extension or "").lower()
-    mime_lower = (mimetype or "").lower()
-    is_heic = ext_lower in {".heic", ".heif"} or mime_lower in {
-        "image/heic",
-        "image/heif",
-        "image/heic-sequence",
-        "image/heif-sequence",
-    }
-    if not is_heic:
-        return file_bytes, mimetype, extension or ".jpg"
+    supabase = get_supabase()
+    resp = run_storage(supabase.storage.from_(bucket).create_signed_upload_url, storage_key)
+    cache.set("uploads", storage_key, pending, UPLOAD_URL_TTL)
+    return {"key": storage_key, "upload_url": resp.get("signed_url"), "token": resp.get("token")}
 
+
+def find_storage_object(bucket: str, storage_key: str) -> Optional[Dict[str, Any]]:
+    """Return the storage listing entry (with ``metadata``) for a key, if it exists."""
+    supabase = get_supabase()
+    folder, _, name = storage_key.rpartition("/")
+    try:
+        items = run_storage(supabase.storage.from_(bucket).list, folder, {"search": name, "limit": 10})
+    except Exception as exc:
+        print("Storage lookup failed:", exc)
+        return None
+    return next((item for item in items or [] if item.get("name") == name), None)
+
+
+def read_storage_head(bucket: str, storage_key: str, length: int = 16) -> bytes:
+    """Return the first ``length`` bytes of a stored object with a ranged GET. Raises if it cannot be read."""
+    import httpx  # Installed with supabase-py; imported here to stay off the cold-start path.
+
+    supabase = get_supabase()
+    url = signed_url_from_response(
+        run_storage(supabase.storage.from_(bucket).create_signed_url, storage_key, 60)
+    )
+    if not url:
+        raise RuntimeError(f"No signed URL for {storage_key}")
+
+    def _read() -> bytes:
+        head = b""
+        with httpx.stream(
+            "GET", url, headers={"Range": f"bytes=0-{length - 1}"}, timeout=SUPABASE_STORAGE_TIMEOUT
+        ) as response:
+            response.raise_for_status()
+            # Stop early in case the range is ignored and the whole object comes back.
+            for chunk in response.iter_bytes():
+                head += chunk
+                if len(head) >= length:
+                    break
+        return head[:length]
+
+    return run_storage(_read)
+
+
+def discard_upload(bucket: str, storage_key: str) -> None:
+    """Remove a directly uploaded object that failed validation, and its upload ticket."""
+    supabase = get_supabase()
     try:
+        run_storage(supabase.storage.from_(bucket).remove, [storage_key])
+    except Exception as exc:
+        print("Rejected upload cleanup failed:", exc)
+    cache.delete("uploads", storage_key)
+
+
+def looks_like_image(head: bytes) -> bool:
+    """Magic-byte check for the formats browsers upload directly (HEIC goes through the app)."""
+    return (
+        head.startswith(IMAGE_SIGNATURES)
+        or (head[:4] == b"RIFF" and head[8:12] == b"WEBP")
+        or head[4:12] in (b"ftypavif", b"ftypavis")
+    )
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an upload exceeds PHOTO_MAX_PIXELS."""
+
+
+_image_module: Any = None
+
+
+def load_image_module() -> Any:
+    """Import Pillow on first use, with the HEIF opener and pixel cap applied once."""
+    global _image_module
+    if _image_module is None:
         from pillow_heif import register_heif_opener
         from PIL import Image
 
         register_heif_opener()
-        img = Image.open(io.BytesIO(file_bytes))
-        output = io.BytesIO()
-        img.convert("RGB").save(output, format="JPEG", quality=90)
+        Image.MAX_IMAGE_PIXELS = PHOTO_MAX_PIXELS
+        _image_module = Image
+    return _image_module
+
+
+def warm_up() -> threading.Thread:
+    """Load supabase-py, the client and Pillow in a background thread.
+
+    Called from the gunicorn ``post_worker_init`` hook (see gunicorn.conf.py),
+    i.e. after the port is bound, so the first request rarely pays for them.
+    Also starts the outbox flusher so writes queued before a restart go out.
+    """
+
+    def _run() -> None:
+        started = time.perf_counter()
+        get_supabase()
+        start_outbox_flusher()
+        try:
+            load_image_module()
+        except Exception as exc:
+            print("Pillow warm-up failed:", exc)
+        print(f"Warm-up finished in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    thread = threading.Thread(target=_run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def hash_stream(stream: IO[bytes]) -> Tuple[str, int]:
+    """Return the SHA-256 hex digest and size of a stream, reading it in chunks."""
+    digest = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+@contextmanager
+def open_for_upload(stream: IO[bytes]) -> Iterator[IO[bytes]]:
+    """Yield a real file holding ``stream``'s contents, which storage3 streams from disk.
+
+    Named temporary files are reopened as they are; anything else is copied
+    to one in chunks first.
+    """
+    name = getattr(stream, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        stream.flush()
+        with open(name, "rb") as upload_file:
+            yield upload_file
+        return
+    with tempfile.NamedTemporaryFile() as copy:
+        stream.seek(0)
+        shutil.copyfileobj(stream, copy, UPLOAD_CHUNK_SIZE)
+        copy.flush()
+        with open(copy.name, "rb") as upload_file:
+            yield upload_file
+
+
+def open_image(stream: IO[bytes]) -> Any:
+    """Open an image lazily and reject it before decoding if it has too many pixels.
+
+    Callers don't close the image, because Pillow would close ``stream`` too.
+    """
+    Image = load_image_module()
+    stream.seek(0)
+    try:
+        img = Image.open(stream)
+    except Image.DecompressionBombError as exc:
+        raise ImageTooLarge(str(exc)) from None
+    if img.width * img.height > PHOTO_MAX_PIXELS:
+        raise ImageTooLarge(f"{img.width}x{img.height} exceeds {PHOTO_MAX_PIXELS} pixels")
+    return img
+
+
+def convert_image_if_needed(stream: IO[bytes], mimetype: str, extension: str) -> Tuple[IO[bytes], str, str]:
+    """Convert HEIC/HEIF images to JPEG for browser compatibility.
+
+    Returns a tuple of (stream, mimetype, extension). Converted images are
+    scaled to PHOTO_MAX_SIDE first; raises ImageTooLarge.
+    """
+    ext_lower = (extension or "").lower()
+    mime_lower = (mimetype or "").lower()
+    is_heic = ext_lower in HEIC_EXTENSIONS or mime_lower in HEIC_MIMETYPES
+    if not is_heic:
+        try:
+            open_image(stream)
+        except ImageTooLarge:
+            raise
+        except Exception:
+            pass  # Not something Pillow reads; store it as uploaded.
+        stream.seek(0)
+        return stream, mimetype, extension or ".jpg"
+
+    try:
+        img = open_image(stream)
+        img.thumbnail((PHOTO_MAX_SIDE, PHOTO_MAX_SIDE))
+        rgb = img if img.mode == "RGB" else img.convert("RGB")
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        rgb.save(output, format="JPEG", quality=90)
         output.seek(0)
-        return output.read(), "image/jpeg", ".jpg"
+        return output, "image/jpeg", ".jpg"
+    except ImageTooLarge:
+        raise
     except Exception as exc:
         print("HEIC conversion failed, using original bytes:", exc)
-        return file_bytes, mimetype, extension or ".jpg"
+        stream.seek(0)
+        return stream, mimetype, extension or ".jpg"
+
+
+def perceptual_hash(stream: IO[bytes]) -> Optional[str]:
+    """Return a 64-bit difference hash (dHash) of an image as 16 hex chars, or None if it cannot be decoded.
+
+    Re-encoded or slightly resized copies of a picture hash to nearby values.
+    """
+    try:
+        Image = load_image_module()
+        img = open_image(stream)
+        # JPEGs can be decoded at a fraction of their size; other formats ignore this.
+        img.draft("L", (64, 64))
+        pixels = list(img.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    except Exception as exc:
+        print("Perceptual hash failed:", exc)
+        return None
+    finally:
+        stream.seek(0)
+
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | int(pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def fetch_perceptual_hashes(student_id: int) -> List[Dict[str, Any]]:
+    """Return ``id`` and ``perceptual_hash`` of the student's hashed photos ([] on failure)."""
+    supabase = get_supabase()
+    try:
+        response = run_db(
+            supabase.table("photos")
+            .select("id,perceptual_hash")
+            .eq("student_id", student_id)
+            .not_.is_("perceptual_hash", "null")
+        )
+    except Exception as exc:
+        print("Perceptual hash lookup failed:", exc)
+        return []
+    return getattr(response, "data", None) or []
+
+
+def find_near_duplicate(photos: List[Dict[str, Any]], phash: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Return the first photo whose perceptual hash is within PHOTO_PHASH_DISTANCE bits."""
+    if not phash:
+        return None
+    value = int(phash, 16)
+    for photo in photos:
+        other = photo.get("perceptual_hash")
+        if not other:
+            continue
+        try:
+            distance = bin(value ^ int(other, 16)).count("1")
+        except ValueError:
+            continue
+        if distance <= PHOTO_PHASH_DISTANCE:
+            return photo
+    return None
 
 
 def fetch_student_by_name(full_name: str) -> Optional[Dict[str, Any]]:
@@ -182,7 +1353,19 @@ def fetch_student_by_name(full_name: str) -> Optional[Dict[str, Any]]:
     if not name:
         return None
 
-    students = fetch_table("shining_brows_student_database")
+    students = cache.get("students", "all")
+    if students is None:
+        try:
+            students = query_table("shining_brows_student_database")
+        except Exception as exc:
+            print("Student list fetch failed:", exc)
+            students = cache.get("stale", "students:all") or []
+            if students:
+                mark_stale()
+        else:
+            if students:
+                cache.set("students", "all", students, STUDENT_CACHE_TTL)
+                cache.set("stale", "students:all", students, STALE_TTL)
     for student in students:
         if student.get("name", "").strip().lower() == name:
             return student
@@ -195,8 +1378,224 @@ def get_current_student() -> Optional[Dict[str, Any]]:
     student_id = session.get("student_id")
     if not student_id:
         return None
-    results = fetch_table("shining_brows_student_database", {"id": student_id})
-    return results[0] if results else None
+    student = cache.get("students", str(student_id))
+    if student is not None:
+        return student
+    try:
+        results = query_table("shining_brows_student_database", {"id": student_id})
+    except Exception as exc:
+        # Keep the session alive on the last-known record rather than logging
+        # everyone out while Supabase is unreachable.
+        print("Student fetch failed:", exc)
+        student = cache.get("stale", f"students:{student_id}")
+        if student is not None:
+            mark_stale()
+        return student
+    if not results:
+        return None
+    cache.set("students", str(student_id), results[0], STUDENT_CACHE_TTL)
+    cache.set("stale", f"students:{student_id}", results[0], STALE_TTL)
+    return results[0]
+
+
+def cached_query(key: str, query: Any) -> List[Dict[str, Any]]:
+    """Return rows for a content list, executing ``query`` only on a cache miss.
+
+    If the query fails the last-known-good rows are served, marked stale.
+    """
+    rows = cache.get("content", key)
+    if rows is not None:
+        return rows
+    try:
+        rows = getattr(run_db(query), "data", []) or []
+    except Exception as exc:
+        stale = cache.get("stale", f"content:{key}")
+        if stale is None:
+            raise
+        print(f"Serving stale {key}:", exc)
+        mark_stale()
+        return stale
+    cache.set("content", key, rows, CONTENT_CACHE_TTL)
+    cache.set("stale", f"content:{key}", rows, STALE_TTL)
+    return rows
+
+
+# ---------- Feed snapshot ----------
+
+# Last snapshot decoded by this worker, reused while the shared feed generation
+# is unchanged so requests skip re-reading it from the cache backend.
+_feed_local: Optional[Dict[str, Any]] = None
+_feed_build_lock = threading.Lock()
+
+
+def invalidate_feed_snapshot() -> None:
+    """Mark the shared feed snapshot stale after a photo, reaction or feedback write."""
+    cache.invalidate("feed")
+
+
+def _feed_snapshot_is_fresh(snapshot: Optional[Dict[str, Any]], version: int) -> bool:
+    return (
+        snapshot is not None
+        and snapshot["version"] == version
+        and time.time() - snapshot["built_at"] < FEED_SNAPSHOT_TTL
+    )
+
+
+def build_feed_snapshot(version: int) -> Dict[str, Any]:
+    """Build the user-independent part of the photo feed.
+
+    ``reactions_by_student`` uses string ids so the snapshot survives a JSON
+    round trip; ``complete`` is False when a secondary lookup failed.
+    """
+    supabase = get_supabase()
+    response = run_db(
+        supabase.table("photos")
+        .select("id,student_id,image_url,feedback,is_monthly_winner,created_at")
+        .order("created_at", desc=True)
+    )
+    photos = getattr(response, "data", []) or []
+
+    complete = True
+    photo_ids = [p.get("id") for p in photos if p.get("id") is not None]
+    reaction_counts: Dict[int, Dict[str, int]] = {}
+    reactions_by_student: Dict[str, Dict[str, str]] = {}
+    feedback_map: Dict[int, List[Dict[str, Any]]] = {}
+    if photo_ids:
+        try:
+            reaction_response = run_db(
+                supabase.table("photo_reactions")
+                .select("photo_id,student_id,reaction")
+                .in_("photo_id", photo_ids)
+            )
+            reaction_rows = getattr(reaction_response, "data", []) or []
+            for row in reaction_rows:
+                pid = row.get("photo_id")
+                kind = row.get("reaction")
+                if pid is None or kind not in ALLOWED_REACTIONS:
+                    continue
+                reaction_counts.setdefault(pid, {}).setdefault(kind, 0)
+                reaction_counts[pid][kind] += 1
+                sid = row.get("student_id")
+                if sid is not None:
+                    reactions_by_student.setdefault(str(sid), {})[str(pid)] = kind
+        except Exception as exc:
+            print("Reaction fetch failed:", exc)
+            complete = False
+        try:
+            feedback_response = run_db(
+                supabase.table("photo_feedbacks")
+                .select("id,photo_id,student_id,feedback,created_at")
+                .in_("photo_id", photo_ids)
+                .order("created_at", desc=True)
+            )
+            feedback_rows = getattr(feedback_response, "data", []) or []
+            for row in feedback_rows:
+                pid = row.get("photo_id")
+                if pid is None:
+                    continue
+                feedback_map.setdefault(pid, []).append(row)
+        except Exception as exc:
+            print("Feedback fetch failed:", exc)
+            complete = False
+
+    try:
+        student_ids = {item.get("student_id") for item in photos if item.get("student_id")}
+        for f_list in feedback_map.values():
+            for f in f_list:
+                sid = f.get("student_id")
+                if sid is not None:
+                    student_ids.add(sid)
+        student_ids_list = list(student_ids)
+        names: Dict[int, str] = {}
+        if student_ids_list:
+            name_response = run_db(
+                supabase.table("shining_brows_student_database")
+                .select("id,name")
+                .in_("id", student_ids_list)
+            )
+            for row in getattr(name_response, "data", []) or []:
+                sid = row.get("id")
+                if sid is not None:
+                    names[int(sid)] = row.get("name", "")
+        for photo in photos:
+            student_id = photo.get("student_id")
+            photo["student_name"] = names.get(student_id, "Uzman")
+            pid = photo.get("id")
+            photo["reactions"] = reaction_counts.get(pid, {})
+            photo_feedbacks = feedback_map.get(pid, [])
+            for fb in photo_feedbacks:
+                fb_student_id = fb.get("student_id")
+                fb["student_name"] = names.get(fb_student_id, "Uzman")
+            photo["feedbacks"] = photo_feedbacks
+            url = build_image_url(photo.get("image_url", ""))
+            if url:
+                photo["image_url"] = url
+    except Exception as exc:
+        print("Student lookup failed:", exc)
+        complete = False
+
+    return {
+        "version": version,
+        "built_at": time.time(),
+        "complete": complete,
+        "photos": photos,
+        "reactions_by_student": reactions_by_student,
+    }
+
+
+def get_feed_snapshot() -> Dict[str, Any]:
+    """Return the current feed snapshot, rebuilding it when stale.
+
+    Its version is the ``feed`` cache generation, so a write in any worker
+    makes every worker rebuild; incomplete snapshots are never cached.
+    """
+    global _feed_local
+    version = cache.generation("feed")
+    if _feed_snapshot_is_fresh(_feed_local, version):
+        return _feed_local  # type: ignore[return-value]
+    shared = cache.get("feed", "snapshot")
+    if _feed_snapshot_is_fresh(shared, version):
+        _feed_local = shared
+        return shared  # type: ignore[return-value]
+
+    # While another thread rebuilds, a copy that only outlived its TTL is served
+    # as is. After a write bumped the version, wait, so writers see their write.
+    previous = _feed_local or cache.get("stale", "feed")
+    serve_previous = previous is not None and previous["version"] == version
+    if serve_previous and not _feed_build_lock.acquire(blocking=False):
+        return previous  # type: ignore[return-value]
+    if not serve_previous:
+        _feed_build_lock.acquire()
+    try:
+        version = cache.generation("feed")
+        snapshot = _feed_local
+        if not _feed_snapshot_is_fresh(snapshot, version):
+            snapshot = cache.get("feed", "snapshot")
+        if _feed_snapshot_is_fresh(snapshot, version):
+            _feed_local = snapshot
+            return snapshot  # type: ignore[return-value]
+
+        try:
+            snapshot = build_feed_snapshot(version)
+        except Exception as exc:
+            stale = cache.get("stale", "feed")
+            if stale is None:
+                raise
+            print("Serving stale feed:", exc)
+            mark_stale()
+            return stale
+        if not snapshot["complete"]:
+            stale = cache.get("stale", "feed")
+            if stale is not None:
+                mark_stale()
+                return stale
+            return snapshot
+        cache.set("feed", "snapshot", snapshot, FEED_SNAPSHOT_TTL)
+        cache.set("stale", "feed", snapshot, STALE_TTL)
+        _feed_local = snapshot
+        return snapshot
+    finally:
+        _feed_build_lock.release()
 
 
 # ---------- Routes ----------
@@ -274,6 +1673,64 @@ def api_auth_check() -> Any:
     return jsonify({"found": True, "requires_password": bool(student.get("password"))}), 200
 
 
+@app.errorhandler(413)
+def request_too_large(_exc: Any) -> Any:
+    return jsonify({"error": "Dosya çok büyük."}), 413
+
+
+# ---------- Static assets ----------
+
+# Output of `npm run build` (assets/build.mjs): fingerprinted CSS/JS/fonts,
+# their .gz/.br variants and manifest.json mapping source names to them.
+DIST_DIR = os.path.join(app.root_path, "static", "dist")
+# A fingerprinted file never changes, so browsers may keep it for a year.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_asset_manifest: Optional[Dict[str, str]] = None
+
+
+def load_asset_manifest() -> Dict[str, str]:
+    """Return the build manifest, or an empty dict when assets were not built.
+
+    Read once per process; in debug mode on every call so rebuilds show up.
+    """
+    global _asset_manifest
+    if _asset_manifest is None or app.debug:
+        try:
+            with open(os.path.join(DIST_DIR, "manifest.json"), encoding="utf-8") as handle:
+                _asset_manifest = json.load(handle)
+        except (OSError, ValueError):
+            _asset_manifest = {}
+    return _asset_manifest
+
+
+@app.context_processor
+def asset_helpers() -> Dict[str, Any]:
+    manifest = load_asset_manifest()
+
+    def asset_url(name: str) -> str:
+        built = manifest.get(name)
+        return url_for("static", filename=f"dist/{built}" if built else name)
+
+    return {"asset_url": asset_url, "assets_built": bool(manifest)}
+
+
+@app.route("/static/dist/<path:filename>")
+def dist_asset(filename: str) -> Any:
+    """Serve build output with immutable caching, preferring a precompressed variant."""
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        variant = safe_join(DIST_DIR, filename + suffix)
+        if request.accept_encodings.quality(encoding) and variant and os.path.isfile(variant):
+            response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename, mimetype=mimetype)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
 @app.route("/service-worker.js")
 def service_worker() -> Any:
     return send_from_directory(os.path.join(app.root_path, "static", "js"), "service-worker.js")
@@ -283,6 +1740,7 @@ def service_worker() -> Any:
 
 @app.route("/api/support", methods=["POST"])
 def api_support() -> Any:
+    supabase = get_supabase()
     student = get_current_student()
     if not student:
         return jsonify({"error": "Oturum bulunamadı"}), 401
@@ -302,39 +1760,59 @@ def api_support() -> Any:
         "status": "open",
     }
 
-    if supabase:
-        try:
-            supabase.table("support_requests").insert(record).execute()
-        except Exception as exc:
-            print("Support insert failed:", exc)
-            return jsonify({"error": "Destek kaydı oluşturulamadı."}), 500
-    else:
+    if not supabase:
         return jsonify({"Supabase Error": "Supabase bağlantı hatası."})
 
-    return jsonify({"ok": True})
+    try:
+        queue_write("support_requests", record, student["id"])
+    except Exception as exc:
+        print("Support enqueue failed:", exc)
+        return jsonify({"error": "Destek kaydı oluşturulamadı."}), 500
+
+    return jsonify({"ok": True, "queued": True}), 202
 
 # ---------- Books ----------
 
 @app.route("/api/books", methods=["GET"])
 def api_books_get() -> Any:
+    supabase = get_supabase()
     if not supabase:
         return jsonify([])
     try:
-        response = (
+        books = cached_query(
+            "books",
             supabase.table("books")
             .select("id,title,pdf_path,pdf_url,created_at")
-            .order("created_at", desc=True)
-            .execute()
+            .order("created_at", desc=True),
         )
-        books = getattr(response, "data", []) or []
         return jsonify(books)
     except Exception as exc:
         print("Books fetch failed:", exc)
         return jsonify([])
 
 
+def insert_book_record(title: str, file_url: str) -> Dict[str, Any]:
+    """Insert a ``books`` row for an uploaded PDF and return it."""
+    supabase = get_supabase()
+    record = {
+        "title": title,
+        "url": file_url,
+        "created_at": datetime.now(UTC).isoformat(),
+    }
+    try:
+        db_response = run_db(supabase.table("books").insert(record))
+        inserted = getattr(db_response, "data", []) or []
+        if inserted:
+            record.update(inserted[0])
+        cache.delete("content", "books")
+    except Exception as exc:
+        print("Book DB insert failed:", exc)
+    return record
+
+
 @app.route("/api/books/upload", methods=["POST"])
 def api_books_upload() -> Any:
+    supabase = get_supabase()
     student = get_current_student()
     if not student:
         return jsonify({"error": "Oturum bulunamadı"}), 401
@@ -352,35 +1830,101 @@ def api_books_upload() -> Any:
     if mimetype not in ("application/pdf", "application/octet-stream") and not mimetype.endswith("pdf"):
         return jsonify({"error": "Sadece PDF yükleyebilirsiniz."}), 400
 
-    file_bytes = book_file.read()
-    if not file_bytes:
+    size = book_file.stream.seek(0, os.SEEK_END)
+    if not size:
         return jsonify({"error": "Dosya boş görünüyor."}), 400
+    if size > BOOK_MAX_BYTES:
+        return jsonify({"error": "Dosya çok büyük."}), 413
 
     storage_key = f"books/{uuid.uuid4().hex}.pdf"
     try:
-        supabase.storage.from_(SUPABASE_BOOK_BUCKET).upload(
-            path=storage_key,
-            file=file_bytes,
-            file_options={"content-type": "application/pdf", "upsert": "false"},
-        )
+        with open_for_upload(book_file.stream) as upload_file:
+            run_storage(
+                supabase.storage.from_(SUPABASE_BOOK_BUCKET).upload,
+                path=storage_key,
+                file=upload_file,
+                file_options={"content-type": "application/pdf", "upsert": "false"},
+            )
         file_url = supabase.storage.from_(SUPABASE_BOOK_BUCKET).get_public_url(storage_key)
     except Exception as exc:
         print("Book upload failed:", exc)
         return jsonify({"error": "PDF yüklenemedi."}), 500
 
-    record = {
-        "title": title,
-        "url": file_url,
-        "created_at": datetime.now(UTC).isoformat(),
-    }
+    return jsonify(insert_book_record(title, file_url)), 201
+
+
+@app.route("/api/books/upload-url", methods=["POST"])
+def api_books_upload_url() -> Any:
+    supabase = get_supabase()
+    student = get_current_student()
+    if not student:
+        return jsonify({"error": "Oturum bulunamadı"}), 401
+    if student.get("role") not in ELEVATED_ROLES:
+        return jsonify({"error": "Yetkisiz işlem"}), 403
+    if not supabase:
+        return jsonify({"error": "Supabase yapılandırması eksik."}), 500
+
+    payload = request.get_json() or {}
+    title = (payload.get("title") or payload.get("filename") or "Kitap").strip()
+    size = payload.get("size")
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({"error": "Dosya boş görünüyor."}), 400
+    if size > BOOK_MAX_BYTES:
+        return jsonify({"error": "Dosya çok büyük."}), 413
+
+    storage_key = f"books/{uuid.uuid4().hex}.pdf"
     try:
-        db_response = supabase.table("books").insert(record).execute()
-        inserted = getattr(db_response, "data", []) or []
-        if inserted:
-            record.update(inserted[0])
+        ticket = issue_upload_url(
+            SUPABASE_BOOK_BUCKET,
+            storage_key,
+            {"kind": "book", "student_id": student["id"], "title": title, "size": size},
+        )
     except Exception as exc:
-        print("Book DB insert failed:", exc)
-    return jsonify(record), 201
+        print("Book upload URL failed:", exc)
+        return jsonify({"error": "PDF yüklenemedi."}), 500
+    return jsonify(ticket)
+
+
+@app.route("/api/books/finalize", methods=["POST"])
+def api_books_finalize() -> Any:
+    supabase = get_supabase()
+    student = get_current_student()
+    if not student:
+        return jsonify({"error": "Oturum bulunamadı"}), 401
+    if student.get("role") not in ELEVATED_ROLES:
+        return jsonify({"error": "Yetkisiz işlem"}), 403
+    if not supabase:
+        return jsonify({"error": "Supabase yapılandırması eksik."}), 500
+
+    payload = request.get_json() or {}
+    storage_key = payload.get("key") or ""
+    pending = cache.get("uploads", storage_key) if storage_key else None
+    if not pending or pending.get("kind") != "book" or pending.get("student_id") != student["id"]:
+        return jsonify({"error": "Geçersiz istek."}), 400
+
+    obj = find_storage_object(SUPABASE_BOOK_BUCKET, storage_key)
+    if not obj:
+        return jsonify({"error": "PDF dosyası bulunamadı"}), 400
+    metadata = obj.get("metadata") or {}
+    if not (metadata.get("mimetype") or "").endswith("pdf") or not metadata.get("size"):
+        return jsonify({"error": "Sadece PDF yükleyebilirsiniz."}), 400
+    # The signed URL does not limit the upload size, so the declared size is
+    # only a promise; check what actually landed in storage.
+    if metadata.get("size") != pending.get("size") or metadata["size"] > BOOK_MAX_BYTES:
+        discard_upload(SUPABASE_BOOK_BUCKET, storage_key)
+        if metadata["size"] > BOOK_MAX_BYTES:
+            return jsonify({"error": "Dosya çok büyük."}), 413
+        return jsonify({"error": "PDF yüklenemedi."}), 400
+
+    try:
+        file_url = supabase.storage.from_(SUPABASE_BOOK_BUCKET).get_public_url(storage_key)
+    except Exception as exc:
+        print("Book public URL failed:", exc)
+        return jsonify({"error": "PDF yüklenemedi."}), 500
+
+    cache.delete("uploads", storage_key)
+    title = (payload.get("title") or pending.get("title") or "Kitap").strip()
+    return jsonify(insert_book_record(title, file_url)), 201
 
 
 # ---------- Photos ----------
@@ -399,8 +1943,67 @@ def api_photos_get() -> Any:
     return jsonify(photos)
 
 
+def find_photo_by_hash(student_id: int, content_hash: str) -> Optional[Dict[str, Any]]:
+    """Return the student's photo with this SHA-256, using the unique index. Raises on failure."""
+    supabase = get_supabase()
+    response = run_db(
+        supabase.table("photos")
+        .select("*")
+        .eq("student_id", student_id)
+        .eq("content_hash", content_hash)
+        .limit(1)
+    )
+    rows = getattr(response, "data", []) or []
+    return rows[0] if rows else None
+
+
+def is_unique_violation(exc: Exception) -> bool:
+    # PostgREST passes the Postgres SQLSTATE through as the error code.
+    return str(getattr(exc, "code", "")) == "23505"
+
+
+def duplicate_photo_response(photo: Dict[str, Any]) -> Any:
+    """Answer a re-upload with the photo the student already has."""
+    response_record = dict(photo)
+    response_record["image_url"] = build_image_url(photo.get("image_url", "")) or photo.get("image_url")
+    response_record["duplicate"] = True
+    return jsonify(response_record), 200
+
+
+def insert_photo_record(
+    student_id: int, storage_key: str, content_hash: str, phash: Optional[str]
+) -> Tuple[Dict[str, Any], bool]:
+    """Insert a ``photos`` row for an object already in storage; returns ``(row, created)``.
+
+    If a concurrent upload of the same file won the race, the existing row is returned.
+    """
+    supabase = get_supabase()
+    record = {
+        "student_id": student_id,
+        "image_url": storage_key,
+        "feedback": None,
+        "is_monthly_winner": False,
+        "content_hash": content_hash,
+        "perceptual_hash": phash,
+        "created_at": datetime.now(UTC).isoformat(),
+    }
+    try:
+        db_response = run_db(supabase.table("photos").insert(record))
+    except Exception as exc:
+        existing = find_photo_by_hash(student_id, content_hash) if is_unique_violation(exc) else None
+        if existing is None:
+            raise
+        return existing, False
+    if getattr(db_response, "data", None):
+        record["id"] = db_response.data[0].get("id", record.get("id"))
+    invalidate_feed_snapshot()
+    record_activity("photos", [record])
+    return record, True
+
+
 @app.route("/api/photos", methods=["POST"])
 def api_photos_post() -> Any:
+    supabase = get_supabase()
     student = get_current_student()
     if not student:
         return jsonify({"error": "Oturum bulunamadı"}), 401
@@ -416,53 +2019,171 @@ def api_photos_post() -> Any:
     filename = photo.filename or ""
     extension = os.path.splitext(filename)[1] or ".jpg"
     mimetype = photo.mimetype or "application/octet-stream"
-    if not mimetype.startswith("image/") and extension.lower() not in {".heic", ".heif"}:
+    if not mimetype.startswith("image/") and extension.lower() not in HEIC_EXTENSIONS:
         return jsonify({"error": "Lütfen geçerli bir resim dosyası yükleyin."}), 400
 
-    file_bytes = photo.read()
-    if not file_bytes:
+    # Werkzeug spools large uploads to disk; hash the stream in chunks rather
+    # than reading it into memory. Hashing the original bytes before any
+    # conversion lets a retried upload be recognised without decoding it.
+    content_hash, size = hash_stream(photo.stream)
+    if not size:
         return jsonify({"error": "Dosya boş görünüyor."}), 400
+    if size > PHOTO_MAX_BYTES:
+        return jsonify({"error": "Dosya çok büyük."}), 413
 
-    file_bytes, mimetype, extension = convert_image_if_needed(file_bytes, mimetype, extension)
-    storage_key = f"{student['id']}/{uuid.uuid4().hex}{extension}"
+    try:
+        duplicate = find_photo_by_hash(student["id"], content_hash)
+    except Exception as exc:
+        print("Photo duplicate lookup failed:", exc)
+        return jsonify({"error": "Fotoğraf yüklenemedi"}), 500
+    if duplicate:
+        return duplicate_photo_response(duplicate)
+
+    try:
+        upload_stream, mimetype, extension = convert_image_if_needed(photo.stream, mimetype, extension)
+    except ImageTooLarge as exc:
+        print("Photo rejected:", exc)
+        return jsonify({"error": "Fotoğraf çözünürlüğü çok yüksek."}), 413
+    phash = perceptual_hash(upload_stream) if PHOTO_PERCEPTUAL_HASH else None
+    near_duplicate = find_near_duplicate(fetch_perceptual_hashes(student["id"]), phash) if phash else None
+    storage_key = f"{student['id']}/{content_hash}{extension}"
 
     try:
         # Ensure header values are strings; some http clients choke on bool values.
-        supabase.storage.from_(SUPABASE_BUCKET).upload(
-            path=storage_key,
-            file=file_bytes,
-            file_options={"content-type": mimetype, "upsert": "false"},
-        )
+        # Keys are content-addressed, so overwriting an object left behind by a
+        # failed earlier attempt rewrites identical bytes.
+        with open_for_upload(upload_stream) as upload_file:
+            run_storage(
+                supabase.storage.from_(SUPABASE_BUCKET).upload,
+                path=storage_key,
+                file=upload_file,
+                file_options={"content-type": mimetype, "upsert": "true"},
+            )
         image_url = build_image_url(storage_key) or storage_key
     except Exception as exc:
         print("Photo upload failed:", exc)
         return jsonify({"error": f"Yükleme başarısız: {exc}"}), 500
+    finally:
+        upload_stream.close()
 
-    record = {
-        "student_id": student["id"],
-        "image_url": storage_key,
-        "feedback": None,
-        "is_monthly_winner": False,
-        "created_at": datetime.now(UTC).isoformat(),
-    }
-
-    if supabase:
-        try:
-            db_response = supabase.table("photos").insert(record).execute()
-            if getattr(db_response, "data", None):
-                record["id"] = db_response.data[0].get("id", record.get("id"))
-        except Exception as exc:
-            print("Photo DB insert failed:", exc)
-            return jsonify({"error": f"Veritabanı kaydı başarısız: {exc}"}), 500
-    else:
-        return jsonify({"error": "Supabase bağlantı hatası."})
+    try:
+        record, created = insert_photo_record(student["id"], storage_key, content_hash, phash)
+    except Exception as exc:
+        print("Photo DB insert failed:", exc)
+        return jsonify({"error": f"Veritabanı kaydı başarısız: {exc}"}), 500
+    if not created:
+        return duplicate_photo_response(record)
     response_record = dict(record)
     response_record["image_url"] = image_url
+    if near_duplicate:
+        response_record["near_duplicate_of"] = near_duplicate.get("id")
+    return jsonify(response_record), 201
+
+
+@app.route("/api/photos/upload-url", methods=["POST"])
+def api_photos_upload_url() -> Any:
+    """Issue a signed URL so the browser can upload a photo straight to storage.
+
+    The client's SHA-256 is only a duplicate-lookup hint within the student's
+    own photos. HEIC files go through ``POST /api/photos`` for conversion.
+    """
+    supabase = get_supabase()
+    student = get_current_student()
+    if not student:
+        return jsonify({"error": "Oturum bulunamadı"}), 401
+    if not supabase:
+        return jsonify({"error": "Supabase yapılandırması eksik."}), 500
+
+    payload = request.get_json() or {}
+    content_hash = (payload.get("sha256") or "").strip().lower()
+    content_type = (payload.get("content_type") or "").strip().lower()
+    size = payload.get("size")
+    extension = (os.path.splitext(payload.get("filename") or "")[1] or ".jpg").lower()
+    if len(content_hash) != 64 or any(ch not in "0123456789abcdef" for ch in content_hash):
+        return jsonify({"error": "Geçersiz istek."}), 400
+    if not content_type.startswith("image/") or content_type in HEIC_MIMETYPES or extension in HEIC_EXTENSIONS:
+        return jsonify({"error": "Lütfen geçerli bir resim dosyası yükleyin."}), 400
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({"error": "Dosya boş görünüyor."}), 400
+    if size > PHOTO_MAX_BYTES:
+        return jsonify({"error": "Dosya çok büyük."}), 413
+
+    try:
+        duplicate = find_photo_by_hash(student["id"], content_hash)
+    except Exception as exc:
+        print("Photo duplicate lookup failed:", exc)
+        return jsonify({"error": "Fotoğraf yüklenemedi"}), 500
+    if duplicate:
+        return duplicate_photo_response(duplicate)
+
+    storage_key = f"{student['id']}/{uuid.uuid4().hex}{extension}"
+    try:
+        ticket = issue_upload_url(
+            SUPABASE_BUCKET,
+            storage_key,
+            {"kind": "photo", "student_id": student["id"], "content_hash": content_hash, "size": size},
+        )
+    except Exception as exc:
+        print("Photo upload URL failed:", exc)
+        return jsonify({"error": f"Yükleme başarısız: {exc}"}), 500
+    return jsonify(ticket)
+
+
+@app.route("/api/photos/finalize", methods=["POST"])
+def api_photos_finalize() -> Any:
+    supabase = get_supabase()
+    student = get_current_student()
+    if not student:
+        return jsonify({"error": "Oturum bulunamadı"}), 401
+    if not supabase:
+        return jsonify({"error": "Supabase yapılandırması eksik."}), 500
+
+    payload = request.get_json() or {}
+    storage_key = payload.get("key") or ""
+    pending = cache.get("uploads", storage_key) if storage_key else None
+    if not pending or pending.get("kind") != "photo" or pending.get("student_id") != student["id"]:
+        return jsonify({"error": "Geçersiz istek."}), 400
+
+    obj = find_storage_object(SUPABASE_BUCKET, storage_key)
+    if not obj:
+        return jsonify({"error": "Fotoğraf yüklenemedi"}), 400
+    metadata = obj.get("metadata") or {}
+    # The signed URL does not limit size or type, so check what actually
+    # landed: listing metadata plus the file's leading bytes.
+    if not (metadata.get("mimetype") or "").startswith("image/") or metadata.get("size") != pending.get("size"):
+        discard_upload(SUPABASE_BUCKET, storage_key)
+        return jsonify({"error": "Lütfen geçerli bir resim dosyası yükleyin."}), 400
+    try:
+        head = read_storage_head(SUPABASE_BUCKET, storage_key)
+    except Exception as exc:
+        print("Photo verification failed:", exc)
+        return jsonify({"error": "Fotoğraf doğrulanamadı, lütfen tekrar deneyin."}), 500
+    if not looks_like_image(head):
+        print(f"Photo rejected: {storage_key} is not an image")
+        discard_upload(SUPABASE_BUCKET, storage_key)
+        return jsonify({"error": "Lütfen geçerli bir resim dosyası yükleyin."}), 400
+
+    try:
+        # The bytes never reach the app, so the hash is the client's and there
+        # is no perceptual hash. The unique index is per student, so a wrong
+        # hash only affects the uploader's own photos.
+        record, created = insert_photo_record(student["id"], storage_key, pending["content_hash"], None)
+    except Exception as exc:
+        print("Photo DB insert failed:", exc)
+        return jsonify({"error": f"Veritabanı kaydı başarısız: {exc}"}), 500
+    if not created:
+        # A concurrent upload of the same file already has a row and its own object.
+        discard_upload(SUPABASE_BUCKET, storage_key)
+        return duplicate_photo_response(record)
+    cache.delete("uploads", storage_key)
+    response_record = dict(record)
+    response_record["image_url"] = build_image_url(storage_key) or storage_key
     return jsonify(response_record), 201
 
 
 @app.route("/api/photos/feed", methods=["GET"])
 def api_photos_feed() -> Any:
+    supabase = get_supabase()
     student = get_current_student()
     if not student:
         return jsonify({"error": "Oturum bulunamadı"}), 401
@@ -471,100 +2192,65 @@ def api_photos_feed() -> Any:
         return jsonify([])
 
     try:
-        response = (
-            supabase.table("photos")
-            .select("id,student_id,image_url,feedback,is_monthly_winner,created_at")
-            .order("created_at", desc=True)
-            .execute()
-        )
-        photos = getattr(response, "data", []) or []
+        snapshot = get_feed_snapshot()
     except Exception as exc:
         print("Photo feed fetch failed:", exc)
         return jsonify({"error": "Fotoğraf akışı alınamadı."}), 500
 
-    photo_ids = [p.get("id") for p in photos if p.get("id") is not None]
-    reaction_counts: Dict[int, Dict[str, int]] = {}
-    my_reactions: Dict[int, str] = {}
-    feedback_map: Dict[int, List[Dict[str, Any]]] = {}
-    if photo_ids:
-        try:
-            reaction_response = (
-                supabase.table("photo_reactions")
-                .select("photo_id,student_id,reaction")
-                .in_("photo_id", photo_ids)
-                .execute()
-            )
-            reaction_rows = getattr(reaction_response, "data", []) or []
-            for row in reaction_rows:
-                pid = row.get("photo_id")
-                kind = row.get("reaction")
-                if pid is None or kind not in ALLOWED_REACTIONS:
-                    continue
-                reaction_counts.setdefault(pid, {}).setdefault(kind, 0)
-                reaction_counts[pid][kind] += 1
-                if row.get("student_id") == student["id"]:
-                    my_reactions[pid] = kind
-        except Exception as exc:
-            print("Reaction fetch failed:", exc)
-        try:
-            feedback_response = (
-                supabase.table("photo_feedbacks")
-                .select("id,photo_id,student_id,feedback,created_at")
-                .in_("photo_id", photo_ids)
-                .order("created_at", desc=True)
-                .execute()
-            )
-            feedback_rows = getattr(feedback_response, "data", []) or []
-            for row in feedback_rows:
-                pid = row.get("photo_id")
-                if pid is None:
-                    continue
-                feedback_map.setdefault(pid, []).append(row)
-        except Exception as exc:
-            print("Feedback fetch failed:", exc)
+    # Only the caller's own reaction differs between users; everything else is shared.
+    my_reactions = snapshot["reactions_by_student"].get(str(student["id"]), {})
+    photos = [dict(photo, my_reaction=my_reactions.get(str(photo.get("id")))) for photo in snapshot["photos"]]
+    overlay_pending_writes(photos, student)
+    response = jsonify(photos)
+    response.headers["X-Feed-Version"] = str(snapshot["version"])
+    return response
+
+
+def parse_photo_id(value: Any) -> Optional[int]:
+    """Return a client-supplied photo id as a positive int, or None if it is not one.
+
+    Queued writes are acknowledged before Supabase sees them, so anything it
+    would reject has to be caught here.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value.strip())
+    return value if isinstance(value, int) and value > 0 else None
 
+
+def overlay_pending_writes(photos: List[Dict[str, Any]], student: Dict[str, Any]) -> None:
+    """Show the caller's queued reactions and feedbacks before they reach Supabase."""
     try:
-        student_ids = {item.get("student_id") for item in photos if item.get("student_id")}
-        for f_list in feedback_map.values():
-            for f in f_list:
-                sid = f.get("student_id")
-                if sid is not None:
-                    student_ids.add(sid)
-        student_ids_list = list(student_ids)
-        names: Dict[int, str] = {}
-        if student_ids_list:
-            name_response = (
-                supabase.table("shining_brows_student_database")
-                .select("id,name")
-                .in_("id", student_ids_list)
-                .execute()
-            )
-            for row in getattr(name_response, "data", []) or []:
-                sid = row.get("id")
-                if sid is not None:
-                    names[int(sid)] = row.get("name", "")
-        for photo in photos:
-            student_id = photo.get("student_id")
-            photo["student_name"] = names.get(student_id, "Uzman")
-            pid = photo.get("id")
-            photo["reactions"] = reaction_counts.get(pid, {})
-            photo["my_reaction"] = my_reactions.get(pid)
-            photo_feedbacks = feedback_map.get(pid, [])
-            for fb in photo_feedbacks:
-                fb_student_id = fb.get("student_id")
-                fb["student_name"] = names.get(fb_student_id, "Uzman")
-            photo["feedbacks"] = photo_feedbacks
-            url = build_image_url(photo.get("image_url", ""))
-            if url:
-                photo["image_url"] = url
+        pending_reactions = {
+            str(row.get("photo_id")): row.get("reaction") for row in outbox.pending("photo_reactions", student["id"])
+        }
+        pending_feedbacks: Dict[str, List[Dict[str, Any]]] = {}
+        for row in outbox.pending("photo_feedbacks", student["id"]):
+            item = dict(row, student_name=student.get("name") or "Uzman")
+            pending_feedbacks.setdefault(str(row.get("photo_id")), []).insert(0, item)
     except Exception as exc:
-        print("Student lookup failed:", exc)
-
-    return jsonify(photos)
+        print("Outbox read failed:", exc)
+        return
+
+    for photo in photos:
+        photo_id = str(photo.get("id"))
+        reaction = pending_reactions.get(photo_id)
+        if reaction and reaction != photo.get("my_reaction"):
+            counts = dict(photo.get("reactions") or {})
+            previous = photo.get("my_reaction")
+            if previous:
+                counts[previous] = max(0, counts.get(previous, 0) - 1)
+            counts[reaction] = counts.get(reaction, 0) + 1
+            photo["reactions"] = counts
+            photo["my_reaction"] = reaction
+        if photo_id in pending_feedbacks:
+            photo["feedbacks"] = pending_feedbacks[photo_id] + list(photo.get("feedbacks") or [])
 
 
 @app.route("/api/photos/reaction", methods=["POST"])
 def api_photos_reaction() -> Any:
+    supabase = get_supabase()
     student = get_current_student()
     if not student:
         return jsonify({"error": "Oturum bulunamadı"}), 401
@@ -572,40 +2258,30 @@ def api_photos_reaction() -> Any:
         return jsonify({"error": "Supabase yapılandırması eksik."}), 500
 
     payload = request.get_json() or {}
-    photo_id = payload.get("photo_id")
+    photo_id = parse_photo_id(payload.get("photo_id"))
     reaction = (payload.get("reaction") or "").strip()
 
     if not photo_id or reaction not in ALLOWED_REACTIONS:
         return jsonify({"error": "Geçersiz istek."}), 400
 
+    record = {
+        "photo_id": photo_id,
+        "student_id": student["id"],
+        "reaction": reaction,
+        "created_at": datetime.now(UTC).isoformat(),
+    }
     try:
-        existing = (
-            supabase.table("photo_reactions")
-            .select("id")
-            .eq("photo_id", photo_id)
-            .eq("student_id", student["id"])
-            .execute()
-        )
-        has_reaction = bool(getattr(existing, "data", []) or [])
-        record = {
-            "photo_id": photo_id,
-            "student_id": student["id"],
-            "reaction": reaction,
-            "created_at": datetime.now(UTC).isoformat(),
-        }
-        if has_reaction:
-            supabase.table("photo_reactions").update(record).eq("photo_id", photo_id).eq("student_id", student["id"]).execute()
-        else:
-            supabase.table("photo_reactions").insert(record).execute()
+        queue_write("photo_reactions", record, student["id"])
     except Exception as exc:
-        print("Reaction save failed:", exc)
+        print("Reaction enqueue failed:", exc)
         return jsonify({"error": "Reaksiyon kaydedilemedi."}), 500
 
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, "queued": True}), 202
 
 
 @app.route("/api/photos/feedback", methods=["POST"])
 def api_photos_feedback() -> Any:
+    supabase = get_supabase()
     student = get_current_student()
     if not student:
         return jsonify({"error": "Oturum bulunamadı"}), 401
@@ -615,30 +2291,62 @@ def api_photos_feedback() -> Any:
         return jsonify({"error": "Supabase yapılandırması eksik."}), 500
 
     payload = request.get_json() or {}
-    photo_id = payload.get("photo_id")
+    photo_id = parse_photo_id(payload.get("photo_id"))
     feedback = (payload.get("feedback") or "").strip()
 
     if not photo_id or not feedback:
         return jsonify({"error": "Geçersiz istek."}), 400
 
+    record = {
+        "photo_id": photo_id,
+        "student_id": student["id"],
+        "feedback": feedback,
+        "created_at": datetime.now(UTC).isoformat(),
+    }
     try:
-        supabase.table("photo_feedbacks").insert(
-            {
-                "photo_id": photo_id,
-                "student_id": student["id"],
-                "feedback": feedback,
-                "created_at": datetime.now(UTC).isoformat(),
-            }
-        ).execute()
+        queue_write("photo_feedbacks", record, student["id"])
     except Exception as exc:
-        print("Feedback save failed:", exc)
+        print("Feedback enqueue failed:", exc)
         return jsonify({"error": "Feedback kaydedilemedi."}), 500
 
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, "queued": True}), 202
+
+
+@app.route("/api/admin/analytics", methods=["GET"])
+def api_admin_analytics() -> Any:
+    supabase = get_supabase()
+    student = get_current_student()
+    if not student:
+        return jsonify({"error": "Oturum bulunamadı"}), 401
+    if student.get("role") not in ELEVATED_ROLES:
+        return jsonify({"error": "Yetkisiz işlem"}), 403
+
+    maybe_reconcile_analytics()
+    try:
+        summary = analytics.summary(ANALYTICS_TOP_N)
+    except Exception as exc:
+        print("Analytics read failed:", exc)
+        return jsonify({"error": "İstatistikler alınamadı."}), 500
+
+    top_students = summary["reactions"]["top_students"]
+    if supabase and top_students:
+        try:
+            name_response = run_db(
+                supabase.table("shining_brows_student_database")
+                .select("id,name")
+                .in_("id", [item["id"] for item in top_students])
+            )
+            names = {str(row.get("id")): row.get("name") for row in getattr(name_response, "data", []) or []}
+            for item in top_students:
+                item["name"] = names.get(item["id"]) or "Uzman"
+        except Exception as exc:
+            print("Analytics name lookup failed:", exc)
+    return jsonify(summary)
 
 
 @app.route("/api/photos/monthly_winner", methods=["POST"])
 def api_photos_monthly_winner() -> Any:
+    supabase = get_supabase()
     student = get_current_student()
     if not student:
         return jsonify({"error": "Oturum bulunamadı"}), 401
@@ -653,16 +2361,18 @@ def api_photos_monthly_winner() -> Any:
         return jsonify({"error": "Geçersiz istek."}), 400
 
     try:
-        supabase.table("photos").update({"is_monthly_winner": False}).eq("is_monthly_winner", True).execute()
-        supabase.table("photos").update({"is_monthly_winner": True}).eq("id", photo_id).execute()
+        run_db(supabase.table("photos").update({"is_monthly_winner": False}).eq("is_monthly_winner", True))
+        run_db(supabase.table("photos").update({"is_monthly_winner": True}).eq("id", photo_id))
     except Exception as exc:
         print("Monthly winner update failed:", exc)
         return jsonify({"error": "Aylık kazanan seçilemedi."}), 500
 
+    invalidate_feed_snapshot()
     return jsonify({"ok": True})
 
 @app.route("/api/quick-tips", methods=["POST", "GET"])
 def quick_tips() -> Any:
+    supabase = get_supabase()
     if not supabase:
         return jsonify([]), 200
 
@@ -676,17 +2386,14 @@ def quick_tips() -> Any:
                 "tip": tip,
                 "created_at": datetime.now(UTC).isoformat(),
             }
-            response = supabase.table("quick_tips").insert(record).execute()
-            inserted = getattr(response, "data", []) or []
-            return jsonify(inserted[0] if inserted else record), 201
+            return jsonify(queue_write("quick_tips", record, None)), 202
 
-        response = (
+        tips = cached_query(
+            "quick_tips",
             supabase.table("quick_tips")
             .select("id,tip,created_at")
-            .order("created_at", desc=True)
-            .execute()
+            .order("created_at", desc=True),
         )
-        tips = getattr(response, "data", []) or []
         return jsonify(tips), 200
     except Exception as exc:
         print("Quick tips fetch failed:", exc)
@@ -695,6 +2402,7 @@ def quick_tips() -> Any:
 
 @app.route("/api/rules", methods=["POST", "GET"])
 def rules():
+    supabase = get_supabase()
     if not supabase:
         return jsonify([]), 200
     
@@ -709,15 +2417,15 @@ def rules():
                 "title": title,
                 "description": description
             }
-            response = supabase.table("rules").insert(record).execute()
+            response = run_db(supabase.table("rules").insert(record))
+            cache.delete("content", "rules")
             inserted = getattr(response, "data", []) or []
             return jsonify(inserted[0 if inserted else record]), 201
-        response = (
+        rules = cached_query(
+            "rules",
             supabase.table("rules")
-            .select("id,title,description")
-            .execute()
+            .select("id,title,description"),
         )
-        rules = getattr(response, "data", []) or []
         return jsonify(rules), 200
     except Exception as e:
         print("Failed to fetch ", e)
@@ -726,6 +2434,7 @@ def rules():
 
 @app.route("/api/workshops", methods=["POST", "GET"])
 def workshops():
+    supabase = get_supabase()
     if not supabase:
         return jsonify([]), 200
     
@@ -744,16 +2453,16 @@ def workshops():
                 "location": location,
                 "date": date,
             }
-            response = supabase.table("workshops").insert(record).execute()
+            response = run_db(supabase.table("workshops").insert(record))
+            cache.delete("content", "workshops")
             inserted = getattr(response, "data", []) or []
             return jsonify(inserted[0] if inserted else record), 201
-        response = (
+        workshops = cached_query(
+            "workshops",
             supabase.table("workshops")
             .select("id,title,instructor,date,location")
-            .order("date", desc=False)
-            .execute()
+            .order("date", desc=False),
         )
-        workshops = getattr(response, "data", []) or []
         return jsonify(workshops), 200
     except Exception as e:
         print("Failed to fetch ", e)
@@ -762,6 +2471,7 @@ def workshops():
 
 @app.route("/api/account/password", methods=["POST"])
 def update_password() -> Any:
+    supabase = get_supabase()
     student = get_current_student()
     if not student:
         return jsonify({"error": "Oturum bulunamadı"}), 401
@@ -775,7 +2485,8 @@ def update_password() -> Any:
 
     try:
         hashed = generate_password_hash(password)
-        supabase.table("shining_brows_student_database").update({"password": hashed}).eq("id", student["id"]).execute()
+        run_db(supabase.table("shining_brows_student_database").update({"password": hashed}).eq("id", student["id"]))
+        cache.invalidate("students")
         return jsonify({"ok": True})
     except Exception as exc:
         print("Password update failed:", exc)
@@ -784,6 +2495,7 @@ def update_password() -> Any:
 
 @app.route("/api/faqs", methods=["POST", "GET"])
 def faqs():
+    supabase = get_supabase()
     if not supabase:
         return jsonify([]), 200
     
@@ -800,15 +2512,15 @@ def faqs():
                 "answer": answer,
                 "category": category,
             }
-            response = supabase.table("question").insert(record).execute()
+            response = run_db(supabase.table("question").insert(record))
+            cache.delete("content", "faqs")
             inserted = getattr(response, "data", []) or []
             return jsonify(inserted[0 if inserted else record]), 201
-        response = (
+        question = cached_query(
+            "faqs",
             supabase.table("faqs")
-            .select("id,question,answer,category")
-            .execute()
+            .select("id,question,answer,category"),
         )
-        question = getattr(response, "data", []) or []
         return jsonify(question), 200
     except Exception as e:
         print("Failed to fetch ", e)
@@ -816,6 +2528,7 @@ def faqs():
     
 @app.route("/api/education", methods=["POST", "GET"])
 def education():
+    supabase = get_supabase()
     if not supabase:
         return jsonify([]), 200
     
@@ -832,15 +2545,15 @@ def education():
                 "content": content,
                 "category": category,
             }
-            response = supabase.table("education_content").insert(record).execute()
+            response = run_db(supabase.table("education_content").insert(record))
+            cache.delete("content", "education_content")
             inserted = getattr(response, "data", []) or []
             return jsonify(inserted[0 if inserted else record]), 201
-        response = (
+        education = cached_query(
+            "education_content",
             supabase.table("education_content")
-            .select("id,title,content,category")
-            .execute()
+            .select("id,title,content,category"),
         )
-        education = getattr(response, "data", []) or []
         return jsonify(education), 200
     except Exception as e:
         print("Failed to fetch ", e)
@@ -848,6 +2561,7 @@ def education():
     
 @app.route("/api/products", methods=["POST", "GET"])
 def products():
+    supabase = get_supabase()
     if not supabase:
         return jsonify([]), 200
     
@@ -864,19 +2578,20 @@ def products():
                 "short_description": short_description,
                 "steps": steps,
             }
-            response = supabase.table("products").insert(record).execute()
+            response = run_db(supabase.table("products").insert(record))
+            cache.delete("content", "products")
             inserted = getattr(response, "data", []) or []
             return jsonify(inserted[0 if inserted else record]), 201
-        response = (
+        question = cached_query(
+            "products",
             supabase.table("products")
-            .select("id,name,short_description,steps")
-            .execute()
+            .select("id,name,short_description,steps"),
         )
-        question = getattr(response, "data", []) or []
         return jsonify(question), 200
     except Exception as e:
         print("Failed to fetch ", e)
         return jsonify([]), 500
 
 if __name__ == "__main__":
+    warm_up()
     app.run(debug=True)
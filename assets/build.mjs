@@ -0,0 +1,91 @@
+// Builds static/dist for production: purged Tailwind CSS with self-hosted
+// DM Sans, minified app.js, content-hashed file names, .gz/.br variants and
+// a manifest.json that Flask reads to resolve asset_url() in templates.
+//
+// Usage: npm ci && npm run build (run `npm install` once to create package-lock.json)
+import { execFileSync } from "node:child_process";
+import { createHash } from "node:crypto";
+import { mkdirSync, mkdtempSync, readFileSync, rmSync, writeFileSync } from "node:fs";
+import { tmpdir } from "node:os";
+import path from "node:path";
+import { fileURLToPath } from "node:url";
+import zlib from "node:zlib";
+import { transform } from "esbuild";
+
+const ROOT = path.resolve(path.dirname(fileURLToPath(import.meta.url)), "..");
+const DIST = path.join(ROOT, "static", "dist");
+const FONT_PACKAGE = path.join(ROOT, "node_modules", "@fontsource", "dm-sans");
+const FONT_WEIGHTS = [400, 500, 700];
+// Fonts are already compressed; only text assets get .gz/.br siblings.
+const COMPRESSIBLE = new Set([".css", ".js"]);
+
+const manifest = {};
+
+function emit(logicalName, contents) {
+  const ext = path.extname(logicalName);
+  const hash = createHash("sha256").update(contents).digest("hex").slice(0, 12);
+  const fileName = `${logicalName.slice(0, -ext.length)}.${hash}${ext}`;
+  const target = path.join(DIST, fileName);
+  mkdirSync(path.dirname(target), { recursive: true });
+  writeFileSync(target, contents);
+  if (COMPRESSIBLE.has(ext)) {
+    writeFileSync(`${target}.gz`, zlib.gzipSync(contents, { level: 9 }));
+    writeFileSync(
+      `${target}.br`,
+      zlib.brotliCompressSync(contents, {
+        params: {
+          [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY,
+          [zlib.constants.BROTLI_PARAM_SIZE_HINT]: contents.length,
+        },
+      })
+    );
+  }
+  manifest[logicalName] = fileName;
+  return fileName;
+}
+
+function buildFontFaces() {
+  // Fontsource ships one @font-face per unicode subset, so browsers fetch only
+  // the subsets a page uses (latin and latin-ext for Turkish text). Font URLs
+  // are rewritten to fingerprinted copies next to the stylesheet.
+  return FONT_WEIGHTS.map((weight) => {
+    const css = readFileSync(path.join(FONT_PACKAGE, `${weight}.css`), "utf8");
+    return css.replace(/url\(\.\/files\/([^)]+)\)/g, (_, file) => {
+      const fileName = emit(`fonts/${file}`, readFileSync(path.join(FONT_PACKAGE, "files", file)));
+      return `url(${fileName})`;
+    });
+  }).join("\n");
+}
+
+async function buildCss() {
+  const fontFaces = await transform(buildFontFaces(), { loader: "css", minify: true });
+  const tmp = mkdtempSync(path.join(tmpdir(), "shiningbrows-assets-"));
+  const output = path.join(tmp, "app.css");
+  try {
+    execFileSync(
+      path.join(ROOT, "node_modules", ".bin", "tailwindcss"),
+      ["--config", "tailwind.config.js", "--input", "assets/app.css", "--output", output, "--minify"],
+      { cwd: ROOT, stdio: "inherit" }
+    );
+    emit("app.css", Buffer.from(fontFaces.code + readFileSync(output, "utf8")));
+  } finally {
+    rmSync(tmp, { recursive: true, force: true });
+  }
+}
+
+async function buildJs() {
+  // app.js is a classic script whose top-level functions are globals; without
+  // a module format esbuild keeps those names while minifying the rest.
+  const source = readFileSync(path.join(ROOT, "static", "js", "app.js"), "utf8");
+  const { code } = await transform(source, { loader: "js", minify: true, target: "es2019", legalComments: "none" });
+  emit("js/app.js", Buffer.from(code));
+}
+
+rmSync(DIST, { recursive: true, force: true });
+mkdirSync(DIST, { recursive: true });
+await buildCss();
+await buildJs();
+writeFileSync(path.join(DIST, "manifest.json"), `${JSON.stringify(manifest, null, 2)}\n`);
+for (const name of ["app.css", "js/app.js"]) {
+  console.log(`${name} -> static/dist/${manifest[name]}`);
+}
@@ -0,0 +1,18 @@
+# Gunicorn reads this file from the working directory, so the Procfile stays
+# `gunicorn app:app`.
+
+
+def post_worker_init(worker):
+    # The worker has loaded the app and is about to accept connections; load
+    # supabase-py, the client and Pillow off the request path.
+    from app import warm_up
+
+    warm_up()
+
+
+def worker_exit(server, worker):
+    # The flusher is a daemon thread and the outbox file does not survive a
+    # dyno restart, so deliver what is queued before the worker goes away.
+    from app import drain_outbox
+
+    drain_outbox()
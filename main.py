@@ -1,5 +1,6 @@
-from app import app
+from app import app, warm_up
 
 
 if __name__ == "__main__":
+    warm_up()
     app.run()
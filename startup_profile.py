@@ -0,0 +1,83 @@
+"""Cold-start report: slowest imports of ``app`` and time to first response.
+
+Usage:
+    python startup_profile.py [--top N] [--budget-ms MS]
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+Exits with status 1 when time-to-first-response exceeds the budget
+(``STARTUP_BUDGET_MS``, default 1500 ms).
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+FIRST_RESPONSE_SNIPPET = """
+import time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get("/login")
+finished = time.perf_counter()
+print(response.status_code, (imported - started) * 1000, (finished - started) * 1000)
+"""
+
+
+def import_profile(top: int) -> list:
+    """Return the ``top`` modules with the largest cumulative import time (us)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|").split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def first_response() -> tuple:
+    """Return (status, import ms, time to first response ms) for GET /login."""
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_RESPONSE_SNIPPET],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    status, import_ms, total_ms = result.stdout.strip().splitlines()[-1].split()
+    return int(status), float(import_ms), float(total_ms)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "1500")))
+    args = parser.parse_args()
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in import_profile(args.top):
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    status, import_ms, total_ms = first_response()
+    print()
+    print(f"import app:           {import_ms:.0f} ms")
+    print(f"first response:       {total_ms:.0f} ms (GET /login -> {status})")
+    print(f"budget:               {args.budget_ms:.0f} ms")
+    if status != 200 or total_ms > args.budget_ms:
+        print("FAIL: time to first response is over budget")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -185,6 +185,40 @@ function refreshWorkshopAdminVisibility() {
   card.classList.toggle("hidden", !canEdit);
   const bookCard = document.getElementById("book-admin-card");
   if (bookCard) bookCard.classList.toggle("hidden", !canEdit);
+  const analyticsCard = document.getElementById("analytics-card");
+  if (analyticsCard) analyticsCard.classList.toggle("hidden", !canEdit);
+  if (canEdit) loadAnalytics();
+}
+
+async function loadAnalytics() {
+  const summary = document.getElementById("analytics-summary");
+  const months = document.getElementById("analytics-months");
+  if (!summary || !months) return;
+  try {
+    const data = await fetchJSON("/api/admin/analytics");
+    const tiles = [
+      ["Fotoğraf", data.photos.total],
+      ["Reaksiyon", data.reactions.total],
+      ["Feedback kapsamı", `%${Math.round(data.feedback.coverage * 100)}`],
+      ["Açık destek talebi", data.support.open],
+    ];
+    summary.innerHTML = tiles
+      .map(
+        ([label, value]) => `
+          <div class="rounded-xl border border-brand-100 bg-brand-50 p-3">
+            <p class="text-xs text-slate-500">${label}</p>
+            <p class="text-lg font-semibold text-slate-800">${value}</p>
+          </div>
+        `
+      )
+      .join("");
+    months.innerHTML = data.photos.by_month
+      .map((item) => `<p class="flex justify-between"><span>${item.month}</span><span>${item.count} fotoğraf</span></p>`)
+      .join("");
+  } catch (err) {
+    console.error(err);
+    summary.innerHTML = `<p class="col-span-2 text-slate-500">İstatistikler alınamadı.</p>`;
+  }
 }
 
 async function loadProducts() {
@@ -505,11 +539,8 @@ function setupBookForm() {
       alert("Lütfen PDF seçin.");
       return;
     }
-    const formData = new FormData();
-    formData.append("book", file);
-    formData.append("title", form.book_title.value);
     try {
-      await fetchJSON("/api/books/upload", { method: "POST", body: formData });
+      await uploadBook(file, form.book_title.value);
       if (success) {
         success.classList.remove("hidden");
         setTimeout(() => success.classList.add("hidden"), 2000);
@@ -522,6 +553,29 @@ function setupBookForm() {
   });
 }
 
+async function uploadBook(file, title) {
+  try {
+    const ticket = await fetchJSON("/api/books/upload-url", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ title, filename: file.name, size: file.size }),
+    });
+    await putToSignedUrl(ticket.upload_url, file, "application/pdf");
+    await fetchJSON("/api/books/finalize", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ key: ticket.key, title }),
+    });
+  } catch (err) {
+    // Direct upload unavailable (e.g. storage CORS); send the file through the app instead.
+    console.warn("Direct book upload failed, falling back:", err);
+    const formData = new FormData();
+    formData.append("book", file);
+    formData.append("title", title);
+    await fetchJSON("/api/books/upload", { method: "POST", body: formData });
+  }
+}
+
 function setupSupportForm() {
   const form = document.getElementById("support-form");
   const success = document.getElementById("support-success");
@@ -530,14 +584,19 @@ function setupSupportForm() {
     e.preventDefault();
     const subject = form.subject.value;
     const message = form.message.value;
+    // Reused when the same submission is retried, so it is only recorded once.
+    if (!form.dataset.idempotencyKey) {
+      form.dataset.idempotencyKey = window.crypto?.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random()}`;
+    }
     try {
       await fetchJSON("/api/support", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", "Idempotency-Key": form.dataset.idempotencyKey },
         body: JSON.stringify({ subject, message }),
       });
       success.classList.remove("hidden");
       form.reset();
+      delete form.dataset.idempotencyKey;
     } catch (err) {
       alert("Gönderilemedi. Lütfen tekrar deneyin.");
     }
@@ -561,11 +620,11 @@ function setupPhotoForm() {
   if (!form) return;
   form.addEventListener("submit", async (e) => {
     e.preventDefault();
-    const formData = new FormData(form);
+    const file = form.photo.files[0];
     const gallery = document.getElementById("photo-gallery");
     if (gallery) gallery.innerHTML = spinner();
     try {
-      await fetchJSON("/api/photos", { method: "POST", body: formData });
+      await uploadPhoto(file, new FormData(form));
       form.reset();
       loadPhotos();
     } catch (err) {
@@ -575,6 +634,61 @@ function setupPhotoForm() {
   });
 }
 
+function isHeic(file) {
+  const name = (file.name || "").toLowerCase();
+  const type = (file.type || "").toLowerCase();
+  return name.endsWith(".heic") || name.endsWith(".heif") || type.startsWith("image/hei");
+}
+
+async function sha256Hex(file) {
+  const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest))
+    .map((b) => b.toString(16).padStart(2, "0"))
+    .join("");
+}
+
+async function putToSignedUrl(url, file, contentType) {
+  const response = await fetch(url, {
+    method: "PUT",
+    headers: { "Content-Type": contentType || file.type || "application/octet-stream" },
+    body: file,
+  });
+  if (response.ok) return;
+  // A retried PUT finds the object from the earlier attempt, which is fine to finalize.
+  const text = await response.text();
+  if (response.status === 409 || text.includes("Duplicate")) return;
+  throw new Error(text || "Yükleme başarısız");
+}
+
+async function uploadPhoto(file, formData) {
+  // HEIC needs server-side conversion; crypto.subtle only exists on secure origins.
+  const canUploadDirect = file && !isHeic(file) && window.crypto && crypto.subtle;
+  if (canUploadDirect) {
+    try {
+      const ticket = await fetchJSON("/api/photos/upload-url", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          sha256: await sha256Hex(file),
+          content_type: file.type,
+          filename: file.name,
+          size: file.size,
+        }),
+      });
+      if (ticket.duplicate) return ticket;
+      await putToSignedUrl(ticket.upload_url, file);
+      return await fetchJSON("/api/photos/finalize", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ key: ticket.key }),
+      });
+    } catch (err) {
+      console.warn("Direct photo upload failed, falling back:", err);
+    }
+  }
+  return fetchJSON("/api/photos", { method: "POST", body: formData });
+}
+
 async function loadPhotos() {
   const gallery = document.getElementById("photo-gallery");
   if (!gallery) return;
@@ -0,0 +1,24 @@
+/** @type {import('tailwindcss').Config} */
+module.exports = {
+  // Only classes found in these files end up in static/dist; app.js builds
+  // most of the dashboard markup, so it is scanned too.
+  content: ["./templates/**/*.html", "./static/js/**/*.js"],
+  theme: {
+    extend: {
+      fontFamily: {
+        display: ['"DM Sans"', "ui-sans-serif", "system-ui"],
+      },
+      colors: {
+        brand: {
+          50: "#fff1f2",
+          100: "#ffe4e6",
+          200: "#fecdd3",
+          400: "#fb7185",
+          500: "#f472b6",
+          600: "#ec4899",
+        },
+      },
+    },
+  },
+  plugins: [],
+};